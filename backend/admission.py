@@ -0,0 +1,339 @@
+"""
+Admission control for Prompt Engine
+Priority classes with concurrency limits and bounded wait queues, plus per-client token-bucket quotas
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Tuple
+
+from profiling import span
+
+logger = logging.getLogger(__name__)
+
+EXEMPT = "exempt"
+
+# Lower priority number wins a freed slot. Bulk routes wait on the model, so they
+# get a small share of the worker and a generous deadline; reads get the rest.
+DEFAULT_CLASSES = {
+    "interactive": {"priority": 0, "concurrency": 64, "queue": 256, "timeout": 2.0, "cost": 1},
+    "standard": {"priority": 1, "concurrency": 32, "queue": 128, "timeout": 5.0, "cost": 1},
+    "bulk": {"priority": 2, "concurrency": 16, "queue": 64, "timeout": 15.0, "cost": 5},
+}
+
+# First match wins; anything unmatched is "standard". Streams hold a connection
+# open for minutes, so they are never counted against a limit.
+ROUTE_CLASSES: List[Tuple[str, "re.Pattern", str]] = [
+    ("GET", re.compile(r"^/(api/health|api/metrics)?$"), EXEMPT),
+    ("GET", re.compile(r"/stream$"), EXEMPT),
+    ("POST", re.compile(r"^/api/(generate|test|prompts/[^/]+/(render|evaluate))$"), "bulk"),
+    ("GET", re.compile(r"^/"), "interactive"),
+]
+
+
+def classify(method: str, path: str) -> str:
+    method = "GET" if method == "HEAD" else method
+    for rule_method, pattern, name in ROUTE_CLASSES:
+        if method == rule_method and pattern.search(path):
+            return name
+    return "standard"
+
+
+class Rejected(Exception):
+    """Request refused before reaching the app"""
+
+    def __init__(self, status: int, reason: str, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status = status
+        self.reason = reason
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    def __init__(self, name: str, priority: int, concurrency: int, queue: int, timeout: float, cost: float):
+        self.name = name
+        self.priority = priority
+        self.concurrency = concurrency
+        self.queue_size = queue
+        self.timeout = timeout  # Longest a request may wait for a slot
+        self.cost = cost  # Quota tokens charged per request
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.service_ms = 100.0  # Moving average of time holding a slot, for Retry-After
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "deadline": 0, "quota": 0}
+
+    def retry_after(self) -> int:
+        waves = (len(self.waiters) + 1) / max(self.concurrency, 1)
+        return max(1, math.ceil(waves * self.service_ms / 1000))
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class ClientQuotas:
+    """Token bucket per client key, refilled at `rate` tokens/s up to `burst`.
+
+    Buckets live in this worker only; with N workers a client's effective
+    quota is up to N times the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, client: str, cost: float) -> float:
+        """Charge `cost` tokens; returns 0 when allowed, else seconds until it would be"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(client, None)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            if len(self._buckets) >= self.max_clients:
+                self._buckets.popitem(last=False)  # Least recently seen client
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        self._buckets[client] = bucket
+
+        cost = min(cost, self.burst)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            return 0.0
+        return (cost - bucket.tokens) / self.rate
+
+    def refund(self, client: str, cost: float):
+        """Return tokens charged for a request that was never served"""
+        bucket = self._buckets.get(client)
+        if bucket is not None:
+            bucket.tokens = min(self.burst, bucket.tokens + min(cost, self.burst))
+
+
+class AdmissionController:
+    """Per-class concurrency limits under a shared worker-wide limit.
+
+    A request runs at once if its class and the worker have a free slot and no
+    request of equal or higher priority is already waiting; otherwise it joins
+    its class's bounded FIFO queue. Freed slots go to the highest-priority
+    waiter, so queued reads overtake queued generations. A full queue or a
+    missed deadline is rejected with 503; an exhausted client quota with 429.
+    """
+
+    def __init__(self, classes: Dict[str, Dict[str, Any]], max_concurrency: int, quotas: ClientQuotas, api_keys: Iterable[str] = ()):
+        self.classes = {name: AdmissionClass(name, **settings) for name, settings in classes.items()}
+        self._by_priority = sorted(self.classes.values(), key=lambda admission_class: admission_class.priority)
+        self.max_concurrency = max_concurrency
+        self.quotas = quotas
+        self.api_keys = frozenset(api_keys)  # X-API-Key values trusted to identify a client
+        self.active = 0
+
+    def _can_start(self, admission_class: AdmissionClass) -> bool:
+        return self.active < self.max_concurrency and admission_class.active < admission_class.concurrency
+
+    def _grant(self, admission_class: AdmissionClass):
+        self.active += 1
+        admission_class.active += 1
+        admission_class.admitted += 1
+
+    def _wake(self):
+        for admission_class in self._by_priority:
+            while admission_class.waiters and self._can_start(admission_class):
+                waiter = admission_class.waiters.popleft()
+                if not waiter.done():
+                    self._grant(admission_class)
+                    waiter.set_result(None)
+            if self.active >= self.max_concurrency:
+                return
+
+    def _reject(self, admission_class: AdmissionClass, reason: str, detail: str, retry_after: int, status: int = 503) -> Rejected:
+        admission_class.rejected[reason] += 1
+        return Rejected(status, reason, detail, retry_after)
+
+    def check_quota(self, class_name: str, client: str):
+        admission_class = self.classes[class_name]
+        if not self.quotas.enabled:
+            return
+        wait = self.quotas.take(client, admission_class.cost)
+        if wait:
+            raise self._reject(admission_class, "quota", "Request quota exceeded", max(1, math.ceil(wait)), status=429)
+
+    def refund_quota(self, class_name: str, client: str):
+        if self.quotas.enabled:
+            self.quotas.refund(client, self.classes[class_name].cost)
+
+    async def acquire(self, class_name: str):
+        admission_class = self.classes[class_name]
+        waiting_ahead = any(
+            other.waiters for other in self._by_priority if other.priority <= admission_class.priority
+        )
+        if not waiting_ahead and self._can_start(admission_class):
+            self._grant(admission_class)
+            return
+
+        if len(admission_class.waiters) >= admission_class.queue_size:
+            raise self._reject(admission_class, "queue_full", "Server busy, try again later", admission_class.retry_after())
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        admission_class.waiters.append(waiter)
+
+        def expire():
+            if not waiter.done():
+                admission_class.waiters.remove(waiter)
+                waiter.set_exception(self._reject(admission_class, "deadline", "Server busy, request timed out in queue", admission_class.retry_after()))
+
+        deadline = loop.call_later(admission_class.timeout, expire)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Client went away while queued, or just after being handed a slot
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release(class_name, 0.0)
+            elif waiter in admission_class.waiters:
+                admission_class.waiters.remove(waiter)
+            raise
+        finally:
+            deadline.cancel()
+
+    def release(self, class_name: str, held_ms: float):
+        admission_class = self.classes[class_name]
+        self.active -= 1
+        admission_class.active -= 1
+        if held_ms:
+            admission_class.service_ms += (held_ms - admission_class.service_ms) * 0.1
+        self._wake()
+
+    def metrics(self) -> str:
+        """Prometheus text exposition of queue depths and rejection counts"""
+        lines = [
+            "# HELP admission_active Requests currently holding a slot",
+            "# TYPE admission_active gauge",
+            *(f'admission_active{{class="{c.name}"}} {c.active}' for c in self._by_priority),
+            "# HELP admission_queue_depth Requests waiting for a slot",
+            "# TYPE admission_queue_depth gauge",
+            *(f'admission_queue_depth{{class="{c.name}"}} {len(c.waiters)}' for c in self._by_priority),
+            "# HELP admission_concurrency_limit Slots per class",
+            "# TYPE admission_concurrency_limit gauge",
+            *(f'admission_concurrency_limit{{class="{c.name}"}} {c.concurrency}' for c in self._by_priority),
+            "# HELP admission_admitted_total Requests admitted",
+            "# TYPE admission_admitted_total counter",
+            *(f'admission_admitted_total{{class="{c.name}"}} {c.admitted}' for c in self._by_priority),
+            "# HELP admission_rejected_total Requests rejected before reaching the app",
+            "# TYPE admission_rejected_total counter",
+            *(
+                f'admission_rejected_total{{class="{c.name}",reason="{reason}"}} {count}'
+                for c in self._by_priority for reason, count in c.rejected.items()
+            ),
+            "# HELP admission_quota_clients Clients with a tracked quota bucket",
+            "# TYPE admission_quota_clients gauge",
+            f"admission_quota_clients {len(self.quotas)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build the controller from environment settings.
+
+        ADMISSION_CLASSES: JSON overriding DEFAULT_CLASSES per class
+        ADMISSION_MAX_CONCURRENCY: slots shared by all classes in this worker
+        CLIENT_QUOTA_RATE / CLIENT_QUOTA_BURST: quota tokens per second and bucket size (rate 0 disables)
+        CLIENT_API_KEYS: comma-separated X-API-Key values that get their own quota
+        """
+        classes = {name: dict(settings) for name, settings in DEFAULT_CLASSES.items()}
+        for name, settings in json.loads(os.getenv("ADMISSION_CLASSES", "{}")).items():
+            if name not in classes:
+                raise ValueError(f"Unknown admission class '{name}'")
+            classes[name].update(settings)
+        quotas = ClientQuotas(float(os.getenv("CLIENT_QUOTA_RATE", "20")), float(os.getenv("CLIENT_QUOTA_BURST", "100")))
+        api_keys = [key.strip() for key in os.getenv("CLIENT_API_KEYS", "").split(",") if key.strip()]
+        return cls(classes, int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64")), quotas, api_keys)
+
+
+def client_key(scope, api_keys: FrozenSet[str] = frozenset()) -> str:
+    """The caller's X-API-Key if it is a known key, otherwise the peer address.
+
+    Unknown keys are ignored: honouring them would let one client mint a fresh
+    quota per request.
+    """
+    for name, value in scope.get("headers", []):
+        if name == b"x-api-key" and value.decode("latin-1") in api_keys:
+            return "key:" + value.decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying AdmissionController to every HTTP request"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        class_name = classify(scope["method"], scope["path"])
+        if class_name == EXEMPT:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_key(scope, self.controller.api_keys)
+        try:
+            self.controller.check_quota(class_name, client)
+        except Rejected as rejected:
+            await self._send_rejection(send, rejected)
+            return
+
+        try:
+            with span("queue"):
+                await self.controller.acquire(class_name)
+        except Rejected as rejected:
+            # Shed before doing any work, so a retry after Retry-After is not charged twice
+            self.controller.refund_quota(class_name, client)
+            await self._send_rejection(send, rejected)
+            return
+        except asyncio.CancelledError:
+            self.controller.refund_quota(class_name, client)
+            raise
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(class_name, (time.perf_counter() - start) * 1000)
+
+    async def _send_rejection(self, send, rejected: Rejected):
+        if rejected.reason != "quota":
+            logger.warning(f"Shed request: {rejected.detail} (retry after {rejected.retry_after}s)")
+        body = json.dumps({"detail": rejected.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": rejected.status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejected.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
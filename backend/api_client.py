@@ -56,6 +56,117 @@ class PromptEngineAPI:
         else:
             raise Exception(f"API Error: {response.status_code} - {response.text}")
     
+    def get_prompt_changes(self, since: int = 0, limit: int = 500) -> Dict[str, Any]:
+        """Get prompt changes (inserts, rating updates, deletes) after a sequence number"""
+        url = f"{self.base_url}/api/prompts/changes"
+        params = {"since": since, "limit": limit}
+        
+        response = requests.get(url, params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def sync_prompts(self, local_prompts: Dict[str, Dict[str, Any]], since: int = 0) -> int:
+        """Bring a local {prompt_id: prompt} copy up to date and return the new sequence number.
+        
+        Pass the returned value as `since` on the next call to only fetch deltas.
+        """
+        while True:
+            feed = self.get_prompt_changes(since)
+            self._apply_prompt_changes(local_prompts, feed)
+            since = feed["last_seq"]
+            if not feed["has_more"]:
+                return since
+    
+    def stream_prompt_changes(self, local_prompts: Dict[str, Dict[str, Any]], since: int = 0):
+        """Keep a local copy in sync from the server push channel.
+        
+        Yields the latest sequence number after each applied batch of changes.
+        """
+        url = f"{self.base_url}/api/prompts/changes/stream"
+        
+        with requests.get(url, params={"since": since}, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API Error: {response.status_code} - {response.text}")
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data: "):
+                    feed = json.loads(line[len("data: "):])
+                    self._apply_prompt_changes(local_prompts, feed)
+                    yield feed["last_seq"]
+    
+    def _apply_prompt_changes(self, local_prompts: Dict[str, Dict[str, Any]], feed: Dict[str, Any]):
+        for change in feed["changes"]:
+            if change["operation"] == "delete":
+                local_prompts.pop(change["prompt_id"], None)
+            else:
+                local_prompts[change["prompt_id"]] = change["prompt"]
+    
+    def find_similar_prompts(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
+        """Find prompts similar to free text"""
+        url = f"{self.base_url}/api/prompts/similar"
+        
+        response = requests.get(url, params={"q": query, "k": k})
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def get_similar_prompts(self, prompt_id: str, k: int = 10) -> List[Dict[str, Any]]:
+        """Find prompts similar to an existing prompt"""
+        url = f"{self.base_url}/api/prompts/{prompt_id}/similar"
+        
+        response = requests.get(url, params={"k": k})
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def save_template(self, prompt_id: str, template: Optional[str] = None) -> Dict[str, Any]:
+        """Save a prompt as a {{variable}} template (defaults to its generated text)"""
+        url = f"{self.base_url}/api/prompts/{prompt_id}/template"
+        data = {"template": template}
+        
+        response = requests.put(url, json=data, headers=self.headers)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def render_template(self, prompt_id: str, variables: List[Dict[str, Any]], missing: str = "error", test: bool = False) -> Dict[str, Any]:
+        """Render a prompt template for a batch of variable sets"""
+        url = f"{self.base_url}/api/prompts/{prompt_id}/render"
+        data = {"variables": variables, "missing": missing, "test": test}
+        
+        response = requests.post(url, json=data, headers=self.headers)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def evaluate_prompt(self, prompt_id: str, inputs: Optional[List[str]] = None, file_id: Optional[int] = None,
+                        assertions: Optional[List[Dict[str, Any]]] = None, concurrency: int = 4) -> Dict[str, Any]:
+        """Start an evaluation run of a prompt against a dataset"""
+        url = f"{self.base_url}/api/prompts/{prompt_id}/evaluate"
+        data = {"inputs": inputs, "file_id": file_id, "assertions": assertions, "concurrency": concurrency}
+        
+        response = requests.post(url, json=data, headers=self.headers)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
+    def get_evaluation(self, run_id: str) -> Dict[str, Any]:
+        """Get evaluation run progress and scores"""
+        url = f"{self.base_url}/api/evaluations/{run_id}"
+        
+        response = requests.get(url)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"API Error: {response.status_code} - {response.text}")
+    
     def rate_prompt(self, prompt_id: str, rating: int) -> Dict[str, Any]:
         """Update prompt rating"""
         url = f"{self.base_url}/api/prompts/{prompt_id}/rate"
@@ -0,0 +1,100 @@
+"""
+Benchmark for the shared cache
+Compares per-process in-memory caches with the node-shared SQLite cache at 1 and N workers
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shared_cache import SharedCache
+
+
+def _zipf_keys(count: int, keys: int, seed: int):
+    # Request keys skewed like real traffic: a few ideas are asked for very often
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(keys)]
+    return rng.choices(range(keys), weights=weights, k=count)
+
+
+def _worker(args):
+    mode, cache_path, requests, keys, miss_ms, capacity, seed = args
+    local = OrderedDict()
+    shared = SharedCache(cache_path) if mode == "shared" else None
+    hits = 0
+    latencies = []
+
+    for key in _zipf_keys(requests, keys, seed):
+        start = time.perf_counter()
+        name = f"gen:{key}"
+        if shared is not None:
+            value = shared.get(name)
+        else:
+            value = local.get(name)
+            if value is not None:
+                local.move_to_end(name)
+        if value is None:
+            time.sleep(miss_ms / 1000)  # Stand-in for the model call
+            value = {"structured_prompt": "x" * 512, "full_prompt_text": "y" * 1024}
+            if shared is not None:
+                shared.set(name, value)
+            else:
+                local[name] = value
+                if len(local) > capacity:
+                    local.popitem(last=False)
+        else:
+            hits += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return hits, latencies
+
+
+def run(mode: str, workers: int, total_requests: int, keys: int, miss_ms: float, capacity: int):
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = os.path.join(directory, "bench_cache.db")
+        SharedCache(cache_path)
+        per_worker = total_requests // workers
+        jobs = [(mode, cache_path, per_worker, keys, miss_ms, capacity, seed) for seed in range(workers)]
+        start = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_worker, jobs)
+        elapsed = time.perf_counter() - start
+
+    hits = sum(worker_hits for worker_hits, _ in results)
+    latencies = sorted(latency for _, worker_latencies in results for latency in worker_latencies)
+    served = len(latencies)
+    return {
+        "mode": mode,
+        "workers": workers,
+        "hit_rate": hits / served,
+        "mean_ms": sum(latencies) / served,
+        "p95_ms": latencies[int(served * 0.95)],
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local and shared cache hit rates across workers")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=4000, help="Total requests across all workers")
+    parser.add_argument("--keys", type=int, default=2000, help="Distinct cache keys")
+    parser.add_argument("--miss-ms", type=float, default=2.0, help="Simulated cost of a cache miss")
+    parser.add_argument("--capacity", type=int, default=1000, help="Entries held by each local cache")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'workers':>8}{'hit rate':>10}{'mean ms':>10}{'p95 ms':>10}{'elapsed s':>11}")
+    for workers in sorted({1, args.workers}):
+        for mode in ("local", "shared"):
+            result = run(mode, workers, args.requests, args.keys, args.miss_ms, args.capacity)
+            print(f"{result['mode']:<8}{result['workers']:>8}{result['hit_rate']:>10.1%}{result['mean_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['elapsed_s']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
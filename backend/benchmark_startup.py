@@ -0,0 +1,66 @@
+"""
+Benchmark for worker cold start
+Measures how long a fresh process takes to import the API and finish its startup hook
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = """
+import time
+start = time.perf_counter()
+import asyncio, json
+import main
+imported = time.perf_counter()
+
+async def boot():
+    await main.startup_event()
+    return time.perf_counter()
+
+ready = asyncio.run(boot())
+print(json.dumps({"import_ms": (imported - start) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def boot_once(workdir: str) -> dict:
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "SHARED_CACHE_PATH": os.path.join(workdir, "cache.db"),
+        "SIMILARITY_INDEX_DIR": os.path.join(workdir, "similarity"),
+    }
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_ms"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold start time")
+    parser.add_argument("--runs", type=int, default=5, help="Warm boots against an already migrated database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        first = boot_once(workdir)
+        warm = [boot_once(workdir) for _ in range(args.runs)]
+
+    print(f"{'boot':<22}{'import ms':>11}{'startup ms':>12}{'process ms':>12}")
+    print(f"{'first (migrations)':<22}{first['import_ms']:>11.1f}{first['startup_ms']:>12.1f}{first['process_ms']:>12.1f}")
+    print(f"{f'warm (median of {args.runs})':<22}"
+          f"{statistics.median(run['import_ms'] for run in warm):>11.1f}"
+          f"{statistics.median(run['startup_ms'] for run in warm):>12.1f}"
+          f"{statistics.median(run['process_ms'] for run in warm):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Shared pytest setup: tests that import main run against a throwaway SQLite
+database, shared cache and similarity index, with the deterministic stub model.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="prompt-engine-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "SHARED_CACHE_PATH": os.path.join(_workdir, "cache", "shared_cache.db"),
+    "SIMILARITY_INDEX_DIR": os.path.join(_workdir, "similarity"),
+    "MODEL_PROVIDER_MODE": "stub",
+    "GEMINI_API_KEY": "",
+    "STATS_CACHE_TTL": "0",
+    "CLIENT_QUOTA_RATE": "0",
+})
+
+
+@pytest.fixture(scope="module")
+def client():
+    """API client with startup hooks run; closed per module so background loops do not outlive it"""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    import main
+
+    main.create_tables()
+    session = main.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,125 @@
+"""
+Evaluation helpers for Prompt Engine
+Dataset parsing, output assertions and aggregate scoring for evaluation runs
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List
+
+ASSERTION_TYPES = ("contains", "not_contains", "regex", "min_length", "max_length")
+
+
+def parse_dataset(filename: str, content: str) -> List[str]:
+    """Parse test inputs from an uploaded dataset file.
+
+    Supports .jsonl/.ndjson (one string or {"input": ...} object per line),
+    .json (a list of the same), .csv (an "input" column, else the first column)
+    and plain text (one input per non-empty line).
+    """
+    extension = os.path.splitext(filename)[1].lower()
+
+    if extension in (".jsonl", ".ndjson"):
+        records = [json.loads(line) for line in content.splitlines() if line.strip()]
+    elif extension == ".json":
+        records = json.loads(content)
+        if not isinstance(records, list):
+            raise ValueError("JSON dataset must be a list of inputs")
+    elif extension == ".csv":
+        rows = list(csv.reader(io.StringIO(content)))
+        if not rows:
+            return []
+        header = [column.strip().lower() for column in rows[0]]
+        if "input" in header:
+            column = header.index("input")
+            rows = rows[1:]
+        else:
+            column = 0
+        records = [row[column] for row in rows if len(row) > column]
+    else:
+        records = content.splitlines()
+
+    inputs = []
+    for record in records:
+        if isinstance(record, dict):
+            record = record.get("input")
+        if record is None:
+            raise ValueError("Every dataset record needs an input")
+        record = record if isinstance(record, str) else json.dumps(record)
+        if record.strip():
+            inputs.append(record)
+    return inputs
+
+
+def validate_assertions(assertions: List[Dict[str, Any]]):
+    """Raise ValueError for unknown assertion types or bad values"""
+    for assertion in assertions:
+        kind = assertion.get("type")
+        value = assertion.get("value")
+        if kind not in ASSERTION_TYPES:
+            raise ValueError(f"Unknown assertion type '{kind}', expected one of: {', '.join(ASSERTION_TYPES)}")
+        if kind in ("min_length", "max_length"):
+            if not isinstance(value, int):
+                raise ValueError(f"{kind} assertion needs an integer value")
+        elif not isinstance(value, str) or not value:
+            raise ValueError(f"{kind} assertion needs a non-empty string value")
+        if kind == "regex":
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"Invalid regex '{value}': {e}")
+
+
+def _text_checks(assertions: List[Dict[str, Any]]) -> List[Callable[[str], bool]]:
+    checks = []
+    for assertion in assertions:
+        kind, value = assertion["type"], assertion["value"]
+        if kind == "contains":
+            checks.append(lambda output, value=value: value in output)
+        elif kind == "not_contains":
+            checks.append(lambda output, value=value: value not in output)
+        elif kind == "regex":
+            checks.append(re.compile(value).search)
+    return checks
+
+
+def summarize_results(outputs: List[str], latencies_ms: List[float], assertions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate length, latency and assertion pass rates over all outputs"""
+    import numpy as np  # Deferred so importing the API does not pay for NumPy at worker boot
+
+    count = len(outputs)
+    summary: Dict[str, Any] = {"count": count}
+    if not count:
+        return summary
+
+    lengths = np.fromiter(map(len, outputs), dtype=np.int64, count=count)
+    latencies = np.asarray(latencies_ms, dtype=np.float64)
+    summary["length"] = {"mean": round(float(lengths.mean()), 1), "min": int(lengths.min()), "max": int(lengths.max())}
+    p50, p95 = np.percentile(latencies, [50, 95])
+    summary["latency_ms"] = {"mean": round(float(latencies.mean()), 1), "p50": round(float(p50), 1), "p95": round(float(p95), 1), "max": round(float(latencies.max()), 1)}
+
+    if assertions:
+        # Build one boolean column per assertion; length bounds are pure array comparisons
+        text_checks = iter(_text_checks(assertions))
+        columns = []
+        for assertion in assertions:
+            kind, value = assertion["type"], assertion["value"]
+            if kind == "min_length":
+                columns.append(lengths >= value)
+            elif kind == "max_length":
+                columns.append(lengths <= value)
+            else:
+                check = next(text_checks)
+                columns.append(np.fromiter((bool(check(output)) for output in outputs), dtype=bool, count=count))
+        passed = np.column_stack(columns)
+        rates = passed.mean(axis=0)
+        summary["assertions"] = [
+            {"type": assertion["type"], "value": assertion["value"], "pass_rate": round(float(rate), 4)}
+            for assertion, rate in zip(assertions, rates)
+        ]
+        summary["pass_rate"] = round(float(passed.all(axis=1).mean()), 4)
+
+    return summary
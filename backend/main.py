@@ -3,22 +3,38 @@ FastAPI Backend for Prompt Engine
 A backend API that provides prompt generation, testing, and management capabilities
 """
 
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Enum, JSON
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi import Request
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Enum, JSON, Float, Boolean, Date, or_, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session, relationship
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, date, timedelta
 from typing import List, Optional, Dict, Any
 import os
 import logging
 import base64
 import uuid
 import json
+import asyncio
+import time
+import hmac
+import hashlib
+import threading
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
+from prompt_templates import compile_template, MISSING_POLICIES
+from evaluation import parse_dataset, validate_assertions, summarize_results
+from profiling import TimingMiddleware, SamplingProfiler, span
+from admission import AdmissionController, AdmissionMiddleware
+from shared_cache import SharedCache
+from providers import ModelRouter, ProviderError
+from tokens import truncate_to_tokens, fit_generation_input, usage_from_response
+import migrations
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
@@ -28,19 +44,30 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Database configuration with SQLite fallback
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL or "localhost" in DATABASE_URL:
-    # Use SQLite for testing when MySQL is not available
-    DATABASE_URL = "sqlite:///./prompt_engine.db"
-    engine = create_engine(DATABASE_URL, echo=False, connect_args={"check_same_thread": False})
-    print("Using SQLite database for testing (MySQL not available)")
-else:
-    engine = create_engine(DATABASE_URL, pool_recycle=300)
-    print(f"Using MySQL database: {DATABASE_URL}")
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_database_url() -> str:
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url or "localhost" in database_url:
+        # Use SQLite for testing when MySQL is not available
+        return "sqlite:///./prompt_engine.db"
+    return database_url
+
+# Sessions are bound to the engine the first time get_engine() runs
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+@lru_cache(maxsize=None)
+def get_engine():
+    """Create the engine on first use so importing this module stays cheap"""
+    database_url = get_database_url()
+    if database_url.startswith("sqlite"):
+        engine = create_engine(database_url, echo=False, connect_args={"check_same_thread": False})
+        logger.info(f"Using SQLite database: {database_url}")
+    else:
+        engine = create_engine(database_url, pool_recycle=300)
+        logger.info(f"Using database: {engine.url.render_as_string(hide_password=True)}")
+    SessionLocal.configure(bind=engine)
+    return engine
+
 # FastAPI app initialization
 app = FastAPI(
     title="Prompt Engine API",
@@ -50,6 +77,11 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Admission control (priority classes, bounded queues, per-client quotas).
+# Added first so it runs inside CORS and timing: rejections still carry both headers.
+admission = AdmissionController.from_env()
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -57,8 +89,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],
 )
 
+# Request timing middleware (Server-Timing header, slow request log)
+profiler = SamplingProfiler()
+app.add_middleware(TimingMiddleware, profiler=profiler)
+
 # Database Models
 class Prompt(Base):
     __tablename__ = "prompts"
@@ -70,6 +107,9 @@ class Prompt(Base):
     rating = Column(Integer, default=0)  # 0=None, 1=Up, 2=Down
     created_at = Column(DateTime, default=datetime.utcnow)
     context_files = Column(JSON)  # List of context files metadata
+    input_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    tokens_estimated = Column(Boolean)  # True when counts are local estimates rather than provider-reported
 
 class TestResult(Base):
     __tablename__ = "test_results"
@@ -79,6 +119,75 @@ class TestResult(Base):
     test_input = Column(Text, nullable=False)
     test_output = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    input_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    tokens_estimated = Column(Boolean)
+
+class PromptTemplate(Base):
+    __tablename__ = "prompt_templates"
+    
+    prompt_id = Column(String(36), ForeignKey("prompts.id"), primary_key=True)
+    template_text = Column(Text, nullable=False)
+    variables = Column(JSON)  # Variable names in order of first use
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EvaluationRun(Base):
+    __tablename__ = "evaluation_runs"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    prompt_id = Column(String(36), ForeignKey("prompts.id"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, completed, failed
+    inputs = Column(JSON, nullable=False)  # Dataset kept with the run so it can resume
+    assertions = Column(JSON)
+    concurrency = Column(Integer, nullable=False, default=4)
+    total = Column(Integer, nullable=False)
+    completed = Column(Integer, nullable=False, default=0)
+    summary = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime)  # Refreshed while a worker is executing the run
+    finished_at = Column(DateTime)
+
+class EvaluationItem(Base):
+    __tablename__ = "evaluation_items"
+    
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    run_id = Column(String(36), ForeignKey("evaluation_runs.id"), nullable=False, index=True)
+    input_index = Column(Integer, nullable=False)
+    test_result_id = Column(Integer, ForeignKey("test_results.id"), nullable=False)
+    latency_ms = Column(Float, nullable=False)
+
+class TokenUsageDaily(Base):
+    """Per-day, per-route token totals for cost reporting"""
+    __tablename__ = "token_usage_daily"
+    
+    day = Column(Date, primary_key=True)
+    route = Column(String(20), primary_key=True)
+    requests = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+
+class PromptChange(Base):
+    """Change log for prompts: one row per prompt holding its latest change.
+
+    Rows are replaced on every insert/rating update/delete, so ``seq`` always
+    increases and deleted prompts remain as tombstones. ``seq`` is taken from
+    a counter row inside the writing transaction (see record_prompt_change),
+    so sequence numbers become visible in commit order.
+    """
+    __tablename__ = "prompt_changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # never reuse sequence numbers
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    prompt_id = Column(String(36), nullable=False, index=True)
+    operation = Column(String(10), nullable=False)  # "upsert" or "delete"
+    changed_at = Column(DateTime, default=datetime.utcnow)
+
+class SequenceCounter(Base):
+    """Named counters incremented under a row lock"""
+    __tablename__ = "sequence_counters"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
 
 class FileUpload(Base):
     __tablename__ = "file_uploads"
@@ -111,6 +220,9 @@ class PromptResponse(BaseModel):
     rating: int
     created_at: datetime
     context_files: Optional[List[Dict[str, Any]]] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    trimmed: Optional[bool] = None  # Set on generate: the request was cut to the route's input budget
 
 class TestRequest(BaseModel):
     prompt: str
@@ -121,23 +233,84 @@ class TestResponse(BaseModel):
 class PromptRatingUpdate(BaseModel):
     rating: int  # 0=None, 1=Up, 2=Down
 
-# AI Integration (using requests to call Gemini API directly)
-import requests
+class TemplateRequest(BaseModel):
+    template: Optional[str] = None  # Defaults to the prompt's generated text
+
+class TemplateResponse(BaseModel):
+    prompt_id: str
+    template: str
+    variables: List[str]
+
+class RenderRequest(BaseModel):
+    variables: List[Dict[str, Any]]
+    missing: str = "error"  # "error", "empty" or "keep"
+    test: bool = False  # Run rendered prompts through the test model
+
+class RenderResponse(BaseModel):
+    outputs: List[Optional[str]]
+    errors: List[Dict[str, Any]]
+    test_results: Optional[List[Optional[str]]] = None
+
+class EvaluateRequest(BaseModel):
+    inputs: Optional[List[str]] = None  # Inline dataset
+    file_id: Optional[int] = None  # Or a dataset uploaded through /api/upload
+    assertions: Optional[List[Dict[str, Any]]] = None  # [{"type": "contains", "value": "..."}]
+    concurrency: int = 4
+
+class EvaluationRunResponse(BaseModel):
+    id: str
+    prompt_id: str
+    status: str
+    total: int
+    completed: int
+    concurrency: int
+    assertions: Optional[List[Dict[str, Any]]] = None
+    summary: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class SimilarPromptResponse(BaseModel):
+    id: str
+    original_idea: str
+    rating: int
+    created_at: datetime
+    score: float
+
+class PromptChangeEntry(BaseModel):
+    seq: int
+    operation: str  # "upsert" or "delete"
+    prompt_id: str
+    prompt: Optional[PromptResponse] = None  # None for deletes
+
+class PromptChangesResponse(BaseModel):
+    changes: List[PromptChangeEntry]
+    last_seq: int
+    has_more: bool
+
+# Node-local cache shared by all worker processes
+@lru_cache(maxsize=None)
+def get_shared_cache() -> SharedCache:
+    return SharedCache(
+        os.getenv("SHARED_CACHE_PATH", os.path.join(os.getcwd(), "cache", "shared_cache.db")),
+        max_bytes=int(os.getenv("SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024
+    )
+
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", "86400"))  # 0 disables
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "5"))
+TOKEN_USAGE_DAYS = int(os.getenv("TOKEN_USAGE_DAYS", "7"))
+
+# AI Integration (providers and per-endpoint model routes live in providers.py)
 
 class AIService:
-    def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY")
-        self.has_api_key = bool(self.api_key)
-        if not self.has_api_key:
-            print("WARNING: GEMINI_API_KEY not found. Using demo responses.")
-        self.api_url = "https://generativelanguage.googleapis.com/v1beta/models"
+    def __init__(self, cache: Optional[SharedCache] = None, router: Optional[ModelRouter] = None):
+        self.cache = cache
+        self.router = router or ModelRouter.from_env()
     
     async def generate_optimized_prompt(self, idea: str, files: Optional[List[Dict]] = None) -> Dict[str, Any]:
-        """Generate optimized prompt using Gemini API"""
+        """Generate optimized prompt using the "generate" model route"""
         try:
-            if self.has_api_key:
-                # Create the system instruction
-                system_instruction = """You are a world-class AI prompt engineer. Your task is to take a user's simple idea and transform it into a highly effective, detailed, and optimized prompt for a large language model.
+            # Create the system instruction
+            system_instruction = """You are a world-class AI prompt engineer. Your task is to take a user's simple idea and transform it into a highly effective, detailed, and optimized prompt for a large language model.
 
 Guidelines:
 1. **Clarity and Specificity:** The prompt must be unambiguous and provide specific instructions.
@@ -155,53 +328,46 @@ Return a JSON object with this structure:
   "format": "The desired output format",
   "examples": ["Example", "of", "desired", "input/output"]
 }"""
-                
-                content = f"{system_instruction}\n\nUser idea: \"{idea}\""
-                if files:
-                    content += "\n\nContext files: "
-                    for file_info in files:
-                        content += f" - {file_info.get('name', 'Unknown file')}"
-                
-                # Call Gemini API
-                response = requests.post(
-                    f"{self.api_url}/gemini-1.5-pro:generateContent",
-                    params={"key": self.api_key},
-                    json={
-                        "contents": [{
-                            "parts": [{"text": content}]
-                        }],
-                        "generationConfig": {
-                            "temperature": 0.1,
-                            "topK": 40,
-                            "topP": 0.8,
-                            "maxOutputTokens": 2048,
-                        }
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise Exception(f"Gemini API error: {response.status_code}")
-                
-                result = response.json()
-                structured_prompt = result["candidates"][0]["content"]["parts"][0]["text"]
-                
-                # Clean up the response to extract JSON
-                structured_prompt = self._extract_json(structured_prompt)
-            else:
-                # Fallback response for demo purposes
-                fallback = {
-                    "persona": "You are an expert assistant specializing in software development",
-                    "task": f"Help with: {idea}",
-                    "constraints": ["Be clear and concise", "Provide practical examples"],
-                    "format": "Provide a step-by-step solution with code examples",
-                    "examples": ["Include error handling", "Add comments to code"]
-                }
-                structured_prompt = json.dumps(fallback)
             
-            return {"structured_prompt": structured_prompt, "full_prompt_text": self._format_prompt_text(structured_prompt)}
+            # Trim oversized ideas and context lists to the route's input budget
+            route = self.router.route("generate")
+            trimmed = False
+            if route.input_token_budget:
+                idea, files, trimmed = fit_generation_input(system_instruction, idea, files, route.input_token_budget)
+            
+            content = f"{system_instruction}\n\nUser idea: \"{idea}\""
+            if files:
+                content += "\n\nContext files: "
+                for file_info in files:
+                    content += f" - {file_info.get('name', 'Unknown file')}"
+            
+            # Identical requests are served from the shared cache
+            cache_key = f"gen:{self.router.cache_namespace('generate')}:{hashlib.sha256(content.encode()).hexdigest()}"
+            if self.cache is not None and GENERATION_CACHE_TTL > 0:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    usage = cached.get("usage")
+                    return {**cached, "usage": {**usage, "cached": True} if usage else None}
+            
+            with span("model"):
+                completion = await self.router.complete("generate", content)
+            
+            # Clean up the response to extract JSON
+            structured_prompt = self._extract_json(completion.text)
+            generated = {
+                "structured_prompt": structured_prompt,
+                "full_prompt_text": self._format_prompt_text(structured_prompt),
+                "usage": {**usage_from_response(completion.usage, content, completion.text), "cached": False},
+                "trimmed": trimmed
+            }
+            if self.cache is not None and GENERATION_CACHE_TTL > 0:
+                self.cache.set(cache_key, generated, ttl=GENERATION_CACHE_TTL)
+            return generated
             
         except Exception as e:
             logger.error(f"Error generating prompt: {str(e)}")
+            if self.router.strict:
+                raise ProviderError(str(e)) from e
             # Fallback response for demo purposes
             fallback = {
                 "persona": "You are an expert assistant specializing in software development",
@@ -211,41 +377,29 @@ Return a JSON object with this structure:
                 "examples": ["Include error handling", "Add comments to code"]
             }
             fallback_json = json.dumps(fallback)
-            return {"structured_prompt": fallback_json, "full_prompt_text": self._format_prompt_text(fallback_json)}
+            return {"structured_prompt": fallback_json, "full_prompt_text": self._format_prompt_text(fallback_json), "usage": None, "trimmed": False}
+    
+    async def test_prompt(self, prompt: str, route: str = "test") -> str:
+        """Test prompt using the given model route ("test" by default)"""
+        text, _ = await self.test_prompt_with_usage(prompt, route)
+        return text
     
-    async def test_prompt(self, prompt: str) -> str:
-        """Test prompt using Gemini Flash"""
+    async def test_prompt_with_usage(self, prompt: str, route: str = "test"):
+        """Test prompt and return (output, usage); usage is None when the fallback was used"""
         try:
-            if self.has_api_key:
-                response = requests.post(
-                    f"{self.api_url}/gemini-1.5-flash:generateContent",
-                    params={"key": self.api_key},
-                    json={
-                        "contents": [{
-                            "parts": [{"text": prompt}]
-                        }],
-                        "generationConfig": {
-                            "temperature": 0.7,
-                            "topK": 40,
-                            "topP": 0.8,
-                            "maxOutputTokens": 1024,
-                        }
-                    }
-                )
-                
-                if response.status_code != 200:
-                    raise Exception(f"Gemini API error: {response.status_code}")
-                
-                result = response.json()
-                return result["candidates"][0]["content"]["parts"][0]["text"].strip()
-            else:
-                # Fallback response for demo
-                return f"This is a demo response for the prompt: {prompt[:100]}... In a real implementation, this would be processed by the AI model to provide a detailed response based on the instructions given."
+            budget = self.router.route(route).input_token_budget
+            if budget:
+                prompt = truncate_to_tokens(prompt, budget)
+            with span("model"):
+                completion = await self.router.complete(route, prompt)
+            return completion.text.strip(), usage_from_response(completion.usage, prompt, completion.text)
             
         except Exception as e:
             logger.error(f"Error testing prompt: {str(e)}")
+            if self.router.strict:
+                raise ProviderError(str(e)) from e
             # Fallback response for demo
-            return f"This is a test response for the prompt: {prompt[:100]}... The AI model would typically process this prompt and provide a detailed response based on the instructions given."
+            return f"This is a test response for the prompt: {prompt[:100]}... The AI model would typically process this prompt and provide a detailed response based on the instructions given.", None
     
     def _extract_json(self, text: str) -> str:
         """Extract JSON from response text"""
@@ -286,11 +440,30 @@ Return a JSON object with this structure:
             logger.error(f"Error formatting prompt text: {e}")
             return structured_prompt
 
-# Initialize AI service
-ai_service = AIService()
+# AI service, created on first use so worker boot does not build providers
+@lru_cache(maxsize=None)
+def get_ai_service() -> AIService:
+    return AIService(cache=get_shared_cache())
+
+# Similarity index over prompt history (NumPy is only imported when first needed)
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+
+def get_similarity_index():
+    # Locked because the startup sync thread and request handlers may race to open it
+    global _similarity_index
+    with _similarity_index_lock:
+        if _similarity_index is None:
+            from similarity_index import SimilarityIndex
+            _similarity_index = SimilarityIndex(
+                os.getenv("SIMILARITY_INDEX_DIR", os.path.join(os.getcwd(), "indexes", "similarity")),
+                dim=int(os.getenv("SIMILARITY_DIM", "256"))
+            )
+        return _similarity_index
 
 # Dependency to get DB session
 def get_db():
+    get_engine()
     db = SessionLocal()
     try:
         yield db
@@ -301,15 +474,433 @@ def get_db():
 # import uuid - already imported at the top
 
 def create_tables():
-    Base.metadata.create_all(bind=engine)
+    """Bring the schema up to date; a single version query when it already is"""
+    return migrations.upgrade(get_engine(), Base.metadata)
+
+def build_prompt_response(prompt: Prompt) -> PromptResponse:
+    """Convert a Prompt row to its API representation"""
+    return PromptResponse(
+        id=prompt.id,
+        original_idea=prompt.original_idea,
+        generated_prompt=json.loads(prompt.generated_prompt_json),
+        generated_prompt_text=prompt.generated_prompt_text,
+        rating=prompt.rating,
+        created_at=prompt.created_at,
+        context_files=prompt.context_files,
+        input_tokens=prompt.input_tokens,
+        output_tokens=prompt.output_tokens
+    )
+
+# Token accounting
+
+def record_token_usage(route: str, input_tokens: int, output_tokens: int, requests: int = 1):
+    """Add to today's token totals for a route; uses its own session so callers' transactions stay small"""
+    values = {"requests": requests, "input_tokens": input_tokens, "output_tokens": output_tokens}
+    get_engine()
+    db = SessionLocal()
+    try:
+        today = date.today()
+        
+        def increment() -> int:
+            updated = db.query(TokenUsageDaily).filter(TokenUsageDaily.day == today, TokenUsageDaily.route == route).update({
+                getattr(TokenUsageDaily, name): getattr(TokenUsageDaily, name) + value for name, value in values.items()
+            }, synchronize_session=False)
+            db.commit()
+            return updated
+        
+        if not increment():
+            try:
+                db.add(TokenUsageDaily(day=today, route=route, **values))
+                db.commit()
+            except IntegrityError:
+                # Another request created today's row first
+                db.rollback()
+                increment()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error recording token usage: {str(e)}")
+    finally:
+        db.close()
+
+def record_usages(route: str, usages: List[Optional[Dict[str, Any]]]):
+    """Roll up a batch of model calls; fallbacks (None) did not reach the model and are skipped"""
+    usages = [usage for usage in usages if usage]
+    if usages:
+        record_token_usage(
+            route,
+            sum(usage["input_tokens"] for usage in usages),
+            sum(usage["output_tokens"] for usage in usages),
+            requests=len(usages)
+        )
+
+def token_columns(usage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Token columns for a Prompt or TestResult row"""
+    if not usage:
+        return {}
+    return {"input_tokens": usage["input_tokens"], "output_tokens": usage["output_tokens"], "tokens_estimated": usage["estimated"]}
+
+# Change feed helpers
+
+class ChangeNotifier:
+    """Wakes up change-feed subscribers in this process when prompts change"""
+    def __init__(self):
+        self._waiters = set()
+    
+    def notify(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+    
+    async def wait(self, timeout: float):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.discard(waiter)
+
+prompt_change_notifier = ChangeNotifier()
+
+def next_sequence(db: Session, name: str) -> int:
+    """Increment a counter; its row stays locked until the caller commits.
+
+    Auto-increment values are assigned at INSERT but become visible at COMMIT,
+    so concurrent writers could publish seq 11 before seq 10 and a reader
+    advancing its cursor to 11 would skip 10. Holding the counter lock to
+    commit makes sequence numbers visible strictly in order.
+    """
+    counter = db.query(SequenceCounter).filter(SequenceCounter.name == name)
+    counter.update({SequenceCounter.value: SequenceCounter.value + 1}, synchronize_session=False)
+    return counter.with_entities(SequenceCounter.value).scalar()
+
+def record_prompt_change(db: Session, prompt_id: str, operation: str):
+    """Replace the prompt's change log row; committed with the caller's transaction"""
+    db.query(PromptChange).filter(PromptChange.prompt_id == prompt_id).delete(synchronize_session=False)
+    db.add(PromptChange(seq=next_sequence(db, "prompt_changes"), prompt_id=prompt_id, operation=operation))
+
+# Evaluation runner
+MAX_EVAL_INPUTS = int(os.getenv("MAX_EVAL_INPUTS", "5000"))
+MAX_EVAL_CONCURRENCY = int(os.getenv("MAX_EVAL_CONCURRENCY", "16"))
+EVAL_WRITE_BATCH = int(os.getenv("EVAL_WRITE_BATCH", "50"))
+EVAL_FLUSH_SECONDS = 1.0
+EVAL_STALE_SECONDS = int(os.getenv("EVAL_STALE_SECONDS", "30"))
+
+evaluation_notifier = ChangeNotifier()
+evaluation_tasks: Dict[str, asyncio.Task] = {}
+
+def read_upload_text(file_record: FileUpload) -> str:
+    """Read an uploaded file as text; stored files never change, so cache forever"""
+    cache_key = f"file:{file_record.filename}"
+    text = get_shared_cache().get(cache_key)
+    if text is None:
+        with span("upload"):
+            with open(file_record.file_path, encoding="utf-8") as upload:
+                text = upload.read()
+        get_shared_cache().set(cache_key, text)
+    return text
+
+def build_evaluation_prompts(db: Session, run: EvaluationRun) -> List[str]:
+    """Combine the prompt with each dataset input.
+    
+    A saved template with an {{input}} variable is rendered; otherwise the
+    input is appended to the generated prompt text.
+    """
+    template = db.query(PromptTemplate).filter(PromptTemplate.prompt_id == run.prompt_id).first()
+    if template:
+        plan = compile_template(template.template_text)
+        if "input" in plan.variables:
+            outputs, _ = plan.render_batch([{"input": value} for value in run.inputs], missing="keep")
+            return outputs
+        prompt_text = template.template_text
+    else:
+        prompt_text = db.query(Prompt.generated_prompt_text).filter(Prompt.id == run.prompt_id).scalar()
+    return [f"{prompt_text}\n\nInput:\n{value}" for value in run.inputs]
+
+def evaluation_summary(db: Session, run: EvaluationRun) -> Dict[str, Any]:
+    rows = (
+        db.query(TestResult.test_output, EvaluationItem.latency_ms)
+        .join(EvaluationItem, EvaluationItem.test_result_id == TestResult.id)
+        .filter(EvaluationItem.run_id == run.id)
+        .all()
+    )
+    return summarize_results([output for output, _ in rows], [latency for _, latency in rows], run.assertions or [])
+
+def build_evaluation_response(run: EvaluationRun, summary: Optional[Dict[str, Any]] = None) -> EvaluationRunResponse:
+    return EvaluationRunResponse(
+        id=run.id,
+        prompt_id=run.prompt_id,
+        status=run.status,
+        total=run.total,
+        completed=run.completed,
+        concurrency=run.concurrency,
+        assertions=run.assertions,
+        summary=summary if summary is not None else run.summary,
+        created_at=run.created_at,
+        finished_at=run.finished_at
+    )
+
+async def run_evaluation(run_id: str):
+    """Execute the remaining inputs of a run, writing results in batches.
+    
+    Each batch commits its test results, evaluation items and progress in one
+    transaction, so a run interrupted by a restart resumes exactly where the
+    last batch left off.
+    """
+    db = SessionLocal()
+    try:
+        run = db.query(EvaluationRun).filter(EvaluationRun.id == run_id).first()
+        done = {index for (index,) in db.query(EvaluationItem.input_index).filter(EvaluationItem.run_id == run_id)}
+        pending = [index for index in range(run.total) if index not in done]
+        prompts = build_evaluation_prompts(db, run)
+        run.status = "running"
+        run.heartbeat_at = datetime.utcnow()
+        db.commit()
+        
+        results = asyncio.Queue()
+        semaphore = asyncio.Semaphore(run.concurrency)
+        
+        async def evaluate_input(index: int):
+            async with semaphore:
+                start = time.perf_counter()
+                output, usage = await get_ai_service().test_prompt_with_usage(prompts[index], route="evaluate")
+                await results.put((index, output, usage, (time.perf_counter() - start) * 1000))
+        
+        def flush(batch):
+            test_results = [
+                TestResult(prompt_id=run.prompt_id, test_input=run.inputs[index], test_output=output, **token_columns(usage))
+                for index, output, usage, _ in batch
+            ]
+            db.add_all(test_results)
+            db.flush()
+            db.add_all([
+                EvaluationItem(run_id=run_id, input_index=index, test_result_id=test_result.id, latency_ms=latency)
+                for (index, _, _, latency), test_result in zip(batch, test_results)
+            ])
+            run.completed += len(batch)
+            run.heartbeat_at = datetime.utcnow()
+            db.commit()
+            if batch:
+                # Empty flushes only refresh the heartbeat; progress subscribers have nothing new to see
+                record_usages("evaluate", [usage for _, _, usage, _ in batch])
+                evaluation_notifier.notify()
+        
+        async def write_results():
+            batch = []
+            last_write = time.monotonic()
+            finished = False
+            while not finished:
+                try:
+                    item = await asyncio.wait_for(results.get(), EVAL_FLUSH_SECONDS)
+                    if item is None:
+                        finished = True
+                    else:
+                        batch.append(item)
+                except asyncio.TimeoutError:
+                    pass
+                # Timed writes also refresh the heartbeat while model calls are slow
+                if finished or len(batch) >= EVAL_WRITE_BATCH or time.monotonic() - last_write >= EVAL_FLUSH_SECONDS:
+                    flush(batch)
+                    batch = []
+                    last_write = time.monotonic()
+        
+        writer = asyncio.create_task(write_results())
+        evaluators = asyncio.gather(*(evaluate_input(index) for index in pending))
+        
+        def stop_on_write_error(task: asyncio.Task):
+            # e.g. the prompt was deleted by another worker: skip the remaining model calls
+            if not task.cancelled() and task.exception() is not None:
+                evaluators.cancel()
+        
+        writer.add_done_callback(stop_on_write_error)
+        try:
+            await evaluators
+        finally:
+            await results.put(None)
+            await writer
+        
+        run.summary = evaluation_summary(db, run)
+        run.status = "completed"
+        run.finished_at = datetime.utcnow()
+        db.commit()
+        
+    except asyncio.CancelledError:
+        # Leave the run as "running"; its heartbeat goes stale and it is resumed
+        raise
+    except Exception as e:
+        logger.error(f"Error in evaluation run {run_id}: {str(e)}")
+        db.rollback()
+        run = db.query(EvaluationRun).filter(EvaluationRun.id == run_id).first()
+        if run:
+            run.status = "failed"
+            run.summary = {"error": str(e)}
+            run.finished_at = datetime.utcnow()
+            db.commit()
+    finally:
+        db.close()
+        evaluation_tasks.pop(run_id, None)
+        evaluation_notifier.notify()
+
+def start_evaluation(run_id: str):
+    if run_id not in evaluation_tasks:
+        evaluation_tasks[run_id] = asyncio.create_task(run_evaluation(run_id))
+
+async def cancel_evaluations(run_ids: List[str]):
+    """Stop this worker's tasks for the given runs and wait for their final writes.
+
+    A run executing on another worker fails its next batch write once the
+    run row is gone, and stops its remaining model calls.
+    """
+    tasks = [evaluation_tasks[run_id] for run_id in run_ids if run_id in evaluation_tasks]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def claim_stale_evaluations(db: Session) -> List[str]:
+    """Atomically take over unfinished runs whose worker stopped heartbeating"""
+    stale_before = datetime.utcfromtimestamp(time.time() - EVAL_STALE_SECONDS)
+    candidates = db.query(EvaluationRun.id).filter(
+        EvaluationRun.status.in_(["pending", "running"]),
+        or_(EvaluationRun.heartbeat_at.is_(None), EvaluationRun.heartbeat_at < stale_before)
+    ).all()
+    claimed = []
+    for (run_id,) in candidates:
+        updated = db.query(EvaluationRun).filter(
+            EvaluationRun.id == run_id,
+            or_(EvaluationRun.heartbeat_at.is_(None), EvaluationRun.heartbeat_at < stale_before)
+        ).update({EvaluationRun.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if updated:
+            claimed.append(run_id)
+    return claimed
+
+async def resume_evaluations_loop():
+    """Resume runs interrupted by a restart, on this or any other worker"""
+    while True:
+        db = SessionLocal()
+        try:
+            for run_id in claim_stale_evaluations(db):
+                if run_id not in evaluation_tasks:
+                    logger.info(f"Resuming evaluation run {run_id}")
+                    start_evaluation(run_id)
+        except Exception as e:
+            logger.error(f"Error resuming evaluations: {str(e)}")
+        finally:
+            db.close()
+        await asyncio.sleep(EVAL_STALE_SECONDS)
+
+# Similarity helpers
+
+def similarity_text(prompt: Prompt) -> str:
+    return f"{prompt.original_idea}\n{prompt.generated_prompt_text}"
+
+def sync_similarity_index(batch_size: int = 1000):
+    """Bring the similarity index up to date with the change feed.
+
+    The index records the last change-feed seq it has applied. Only a missing
+    or foreign index is rebuilt (aside, without blocking readers); otherwise
+    the changes since that seq are replayed, which also catches up prompts
+    generated by other workers while this one was starting.
+    """
+    db = SessionLocal()
+    try:
+        index = get_similarity_index()
+        since = index.synced_seq()
+        latest = db.query(func.max(PromptChange.seq)).scalar() or 0
+        
+        if since is None or since > latest:
+            # Snapshot the feed position first: prompts committed during the scan are replayed below
+            rows = db.query(Prompt.id, Prompt.original_idea, Prompt.generated_prompt_text).yield_per(batch_size)
+            if not index.rebuild(((prompt_id, f"{idea}\n{text}") for prompt_id, idea, text in rows), seq=latest):
+                logger.info("Similarity index is being rebuilt by another worker")
+                return
+            logger.info(f"Rebuilt similarity index with {len(index)} prompts")
+            since = latest
+        
+        applied = 0
+        while True:
+            changes = db.query(PromptChange).filter(PromptChange.seq > since).order_by(PromptChange.seq).limit(batch_size).all()
+            if not changes:
+                break
+            prompts = {prompt.id: prompt for prompt in db.query(Prompt).filter(
+                Prompt.id.in_([change.prompt_id for change in changes if change.operation == "upsert"])
+            ).all()}
+            upserts = [(prompt_id, similarity_text(prompt)) for prompt_id, prompt in prompts.items()]
+            deletes = [change.prompt_id for change in changes if change.prompt_id not in prompts]
+            since = changes[-1].seq
+            index.apply_changes(upserts, deletes, since)
+            applied += len(changes)
+        if applied:
+            logger.info(f"Applied {applied} prompt changes to the similarity index")
+    except Exception as e:
+        logger.error(f"Error syncing similarity index: {str(e)}")
+    finally:
+        db.close()
+
+def update_similarity_index(operation: str, prompt_id: str, text: Optional[str] = None):
+    """Apply a change to the index; failures are logged because the prompt itself is already committed"""
+    try:
+        if operation == "upsert":
+            get_similarity_index().add(prompt_id, text)
+        else:
+            get_similarity_index().remove(prompt_id)
+    except Exception as e:
+        logger.error(f"Error updating similarity index for {prompt_id}: {str(e)}")
+
+async def find_similar_prompts(db: Session, text: str, k: int, exclude: Optional[str] = None) -> List[SimilarPromptResponse]:
+    # Off the event loop: the search may wait on another worker's index lock
+    matches = await asyncio.to_thread(lambda: get_similarity_index().search(text, k, exclude=exclude))
+    if not matches:
+        return []
+    prompts = {prompt.id: prompt for prompt in db.query(Prompt).filter(Prompt.id.in_([prompt_id for prompt_id, _ in matches])).all()}
+    return [
+        SimilarPromptResponse(
+            id=prompt_id,
+            original_idea=prompts[prompt_id].original_idea,
+            rating=prompts[prompt_id].rating,
+            created_at=prompts[prompt_id].created_at,
+            score=round(score, 4)
+        )
+        for prompt_id, score in matches if prompt_id in prompts
+    ]
+
+def collect_prompt_changes(db: Session, since: int, limit: int) -> PromptChangesResponse:
+    """Return up to `limit` changes with a sequence number greater than `since`"""
+    rows = db.query(PromptChange).filter(PromptChange.seq > since).order_by(PromptChange.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    upsert_ids = [row.prompt_id for row in rows if row.operation == "upsert"]
+    prompts = {}
+    if upsert_ids:
+        prompts = {prompt.id: prompt for prompt in db.query(Prompt).filter(Prompt.id.in_(upsert_ids)).all()}
+    
+    changes = []
+    for row in rows:
+        prompt = prompts.get(row.prompt_id)
+        if row.operation == "upsert" and prompt is not None:
+            changes.append(PromptChangeEntry(seq=row.seq, operation="upsert", prompt_id=row.prompt_id, prompt=build_prompt_response(prompt)))
+        else:
+            changes.append(PromptChangeEntry(seq=row.seq, operation="delete", prompt_id=row.prompt_id))
+    
+    return PromptChangesResponse(
+        changes=changes,
+        last_seq=rows[-1].seq if rows else since,
+        has_more=has_more
+    )
 
 # API Routes
 
 @app.on_event("startup")
 async def startup_event():
     try:
-        create_tables()
-        logger.info("Prompt Engine API started successfully with database")
+        version = create_tables()
+        # Readiness only waits for the version check; the rest warms up in the background
+        asyncio.create_task(asyncio.to_thread(sync_similarity_index))
+        asyncio.create_task(resume_evaluations_loop())
+        logger.info(f"Prompt Engine API started successfully with database (schema version {version})")
     except Exception as e:
         logger.error(f"Startup error: {e}")
         # Continue startup even if database setup fails
@@ -332,36 +923,54 @@ async def generate_prompt(request: PromptRequest, db: Session = Depends(get_db))
             raise HTTPException(status_code=400, detail="Idea cannot be empty")
         
         # Generate prompt using AI
-        result = await ai_service.generate_optimized_prompt(request.idea, request.files)
-        structured_prompt = json.loads(result["structured_prompt"])
+        result = await get_ai_service().generate_optimized_prompt(request.idea, request.files)
+        with span("parse"):
+            structured_prompt = json.loads(result["structured_prompt"])
+        
+        # Cache hits cost nothing, so only calls that reached the model are counted
+        usage = result["usage"] if result["usage"] and not result["usage"]["cached"] else None
         
         # Save to database
         prompt = Prompt(
             original_idea=request.idea,
             generated_prompt_json=json.dumps(structured_prompt),
             generated_prompt_text=result["full_prompt_text"],
-            context_files=request.files
+            context_files=request.files,
+            **token_columns(usage)
         )
         
-        db.add(prompt)
-        db.commit()
-        db.refresh(prompt)
+        with span("db"):
+            db.add(prompt)
+            db.flush()
+            record_prompt_change(db, prompt.id, "upsert")
+            db.commit()
+            db.refresh(prompt)
+            record_usages("generate", [usage])
+        prompt_change_notifier.notify()
+        with span("index"):
+            await asyncio.to_thread(update_similarity_index, "upsert", prompt.id, similarity_text(prompt))
         
         # Convert to response format
-        response = PromptResponse(
-            id=prompt.id,
-            original_idea=prompt.original_idea,
-            generated_prompt=structured_prompt,
-            generated_prompt_text=prompt.generated_prompt_text,
-            rating=prompt.rating,
-            created_at=prompt.created_at,
-            context_files=prompt.context_files
-        )
+        with span("serialize"):
+            response = PromptResponse(
+                id=prompt.id,
+                original_idea=prompt.original_idea,
+                generated_prompt=structured_prompt,
+                generated_prompt_text=prompt.generated_prompt_text,
+                rating=prompt.rating,
+                created_at=prompt.created_at,
+                context_files=prompt.context_files,
+                input_tokens=prompt.input_tokens,
+                output_tokens=prompt.output_tokens,
+                trimmed=result.get("trimmed", False)
+            )
         
         return response
         
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Failed to parse AI response")
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail=f"Model provider error: {str(e)}")
     except Exception as e:
         logger.error(f"Error in generate_prompt: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -374,9 +983,12 @@ async def test_prompt_endpoint(request: TestRequest):
         if not request.prompt.strip():
             raise HTTPException(status_code=400, detail="Prompt cannot be empty")
         
-        result = await ai_service.test_prompt(request.prompt)
+        result, usage = await get_ai_service().test_prompt_with_usage(request.prompt)
+        record_usages("test", [usage])
         return TestResponse(test_result=result)
         
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail=f"Model provider error: {str(e)}")
     except Exception as e:
         logger.error(f"Error in test_prompt: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -400,28 +1012,266 @@ async def get_prompts(
         if rating is not None:
             query = query.filter(Prompt.rating == rating)
         
-        prompts = query.order_by(Prompt.created_at.desc()).offset(skip).limit(limit).all()
+        with span("db"):
+            prompts = query.order_by(Prompt.created_at.desc()).offset(skip).limit(limit).all()
         
-        results = []
-        for prompt in prompts:
-            structured_prompt = json.loads(prompt.generated_prompt_json)
-            response = PromptResponse(
-                id=prompt.id,
-                original_idea=prompt.original_idea,
-                generated_prompt=structured_prompt,
-                generated_prompt_text=prompt.generated_prompt_text,
-                rating=prompt.rating,
-                created_at=prompt.created_at,
-                context_files=prompt.context_files
-            )
-            results.append(response)
-        
-        return results
+        with span("serialize"):
+            return [build_prompt_response(prompt) for prompt in prompts]
         
     except Exception as e:
         logger.error(f"Error in get_prompts: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/prompts/changes", response_model=PromptChangesResponse)
+async def get_prompt_changes(since: int = 0, limit: int = 500, db: Session = Depends(get_db)):
+    """Get inserts, rating updates and deletes since a change sequence number"""
+    try:
+        if since < 0 or not 1 <= limit <= 1000:
+            raise HTTPException(status_code=400, detail="since must be >= 0 and limit between 1 and 1000")
+        
+        return collect_prompt_changes(db, since, limit)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_prompt_changes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/prompts/changes/stream")
+async def stream_prompt_changes(request: Request, since: int = 0):
+    """Push prompt changes to the client as Server-Sent Events"""
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        since = max(since, int(last_event_id))
+    
+    async def event_stream():
+        cursor = since
+        while not await request.is_disconnected():
+            db = SessionLocal()
+            try:
+                feed = collect_prompt_changes(db, cursor, 500)
+            finally:
+                db.close()
+            
+            if feed.changes:
+                cursor = feed.last_seq
+                yield f"id: {cursor}\nevent: changes\ndata: {feed.model_dump_json()}\n\n"
+                if feed.has_more:
+                    continue
+            else:
+                yield ": keepalive\n\n"
+            
+            # Other workers' writes are picked up by the timeout poll
+            await prompt_change_notifier.wait(15)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/prompts/similar", response_model=List[SimilarPromptResponse])
+async def search_similar_prompts(q: str, k: int = 10, db: Session = Depends(get_db)):
+    """Find prompts similar to free text"""
+    try:
+        if not q.strip() or not 1 <= k <= 100:
+            raise HTTPException(status_code=400, detail="q cannot be empty and k must be between 1 and 100")
+        
+        return await find_similar_prompts(db, q, k)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in search_similar_prompts: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/prompts/{prompt_id}/similar", response_model=List[SimilarPromptResponse])
+async def get_similar_prompts(prompt_id: str, k: int = 10, db: Session = Depends(get_db)):
+    """Find prompts similar to an existing prompt"""
+    try:
+        if not 1 <= k <= 100:
+            raise HTTPException(status_code=400, detail="k must be between 1 and 100")
+        
+        prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+        if not prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        
+        return await find_similar_prompts(db, similarity_text(prompt), k, exclude=prompt_id)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_similar_prompts: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Prompt Template Endpoints
+MAX_RENDER_SETS = int(os.getenv("MAX_RENDER_SETS", "10000"))
+MAX_RENDER_TEST_SETS = int(os.getenv("MAX_RENDER_TEST_SETS", "20"))
+
+@app.put("/api/prompts/{prompt_id}/template", response_model=TemplateResponse)
+async def save_template(prompt_id: str, request: TemplateRequest, db: Session = Depends(get_db)):
+    """Save a prompt as a {{variable}} template"""
+    try:
+        prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+        if not prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        
+        template_text = request.template if request.template is not None else prompt.generated_prompt_text
+        plan = compile_template(template_text)
+        
+        template = db.query(PromptTemplate).filter(PromptTemplate.prompt_id == prompt_id).first()
+        if template:
+            template.template_text = template_text
+            template.variables = plan.variables
+        else:
+            db.add(PromptTemplate(prompt_id=prompt_id, template_text=template_text, variables=plan.variables))
+        db.commit()
+        
+        return TemplateResponse(prompt_id=prompt_id, template=template_text, variables=plan.variables)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in save_template: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/prompts/{prompt_id}/template", response_model=TemplateResponse)
+async def get_template(prompt_id: str, db: Session = Depends(get_db)):
+    """Get the saved template for a prompt"""
+    template = db.query(PromptTemplate).filter(PromptTemplate.prompt_id == prompt_id).first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    return TemplateResponse(prompt_id=prompt_id, template=template.template_text, variables=template.variables or [])
+
+@app.post("/api/prompts/{prompt_id}/render", response_model=RenderResponse)
+async def render_template(prompt_id: str, request: RenderRequest, db: Session = Depends(get_db)):
+    """Render a prompt template for many variable sets, optionally testing the results"""
+    try:
+        if request.missing not in MISSING_POLICIES:
+            raise HTTPException(status_code=400, detail=f"missing must be one of: {', '.join(MISSING_POLICIES)}")
+        if len(request.variables) > MAX_RENDER_SETS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_RENDER_SETS} variable sets per request")
+        if request.test and len(request.variables) > MAX_RENDER_TEST_SETS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_RENDER_TEST_SETS} variable sets can be tested per request")
+        
+        template = db.query(PromptTemplate).filter(PromptTemplate.prompt_id == prompt_id).first()
+        if template:
+            template_text = template.template_text
+        else:
+            prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+            if not prompt:
+                raise HTTPException(status_code=404, detail="Prompt not found")
+            template_text = prompt.generated_prompt_text
+        
+        outputs, errors = compile_template(template_text).render_batch(request.variables, request.missing)
+        response = RenderResponse(outputs=outputs, errors=errors)
+        
+        if request.test:
+            rendered = [(values, output) for values, output in zip(request.variables, outputs) if output is not None]
+            tested = await asyncio.gather(*(get_ai_service().test_prompt_with_usage(output) for _, output in rendered))
+            
+            remaining = iter(test_output for test_output, _ in tested)
+            response.test_results = [next(remaining) if output is not None else None for output in outputs]
+            
+            db.add_all([
+                TestResult(prompt_id=prompt_id, test_input=json.dumps(values), test_output=test_output, **token_columns(usage))
+                for (values, _), (test_output, usage) in zip(rendered, tested)
+            ])
+            db.commit()
+            record_usages("test", [usage for _, usage in tested])
+        
+        return response
+        
+    except HTTPException:
+        raise
+    except ProviderError as e:
+        raise HTTPException(status_code=502, detail=f"Model provider error: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error in render_template: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Evaluation Endpoints
+@app.post("/api/prompts/{prompt_id}/evaluate", response_model=EvaluationRunResponse)
+async def evaluate_prompt(prompt_id: str, request: EvaluateRequest, db: Session = Depends(get_db)):
+    """Start a run of the prompt against a dataset of test inputs"""
+    try:
+        if not db.query(Prompt.id).filter(Prompt.id == prompt_id).first():
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        if (request.inputs is None) == (request.file_id is None):
+            raise HTTPException(status_code=400, detail="Provide either inputs or file_id")
+        if not 1 <= request.concurrency <= MAX_EVAL_CONCURRENCY:
+            raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {MAX_EVAL_CONCURRENCY}")
+        
+        try:
+            validate_assertions(request.assertions or [])
+            if request.file_id is not None:
+                file_record = db.query(FileUpload).filter(FileUpload.id == request.file_id).first()
+                if not file_record:
+                    raise HTTPException(status_code=404, detail="File not found")
+                inputs = parse_dataset(file_record.original_name, read_upload_text(file_record))
+            else:
+                inputs = [value for value in request.inputs if value.strip()]
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid dataset: {str(e)}")
+        
+        if not inputs:
+            raise HTTPException(status_code=400, detail="Dataset has no inputs")
+        if len(inputs) > MAX_EVAL_INPUTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_EVAL_INPUTS} inputs per run")
+        
+        run = EvaluationRun(
+            prompt_id=prompt_id,
+            inputs=inputs,
+            assertions=request.assertions,
+            concurrency=request.concurrency,
+            total=len(inputs),
+            heartbeat_at=datetime.utcnow()
+        )
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+        
+        start_evaluation(run.id)
+        return build_evaluation_response(run)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in evaluate_prompt: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/evaluations/{run_id}", response_model=EvaluationRunResponse)
+async def get_evaluation(run_id: str, db: Session = Depends(get_db)):
+    """Get evaluation progress and aggregate scores (partial while running)"""
+    run = db.query(EvaluationRun).filter(EvaluationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Evaluation run not found")
+    
+    if run.status in ("pending", "running"):
+        return build_evaluation_response(run, evaluation_summary(db, run))
+    return build_evaluation_response(run)
+
+@app.get("/api/evaluations/{run_id}/stream")
+async def stream_evaluation(run_id: str, request: Request):
+    """Stream evaluation progress as Server-Sent Events until the run finishes"""
+    async def event_stream():
+        while not await request.is_disconnected():
+            db = SessionLocal()
+            try:
+                run = db.query(EvaluationRun).filter(EvaluationRun.id == run_id).first()
+                if not run:
+                    yield f"event: error\ndata: {json.dumps({'detail': 'Evaluation run not found'})}\n\n"
+                    return
+                progress = {"id": run.id, "status": run.status, "completed": run.completed, "total": run.total}
+                if run.status in ("completed", "failed"):
+                    progress["summary"] = run.summary
+            finally:
+                db.close()
+            
+            yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+            if progress["status"] in ("completed", "failed"):
+                return
+            await evaluation_notifier.wait(5)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.post("/api/prompts/{prompt_id}/rate")
 async def rate_prompt(prompt_id: str, rating_update: PromptRatingUpdate, db: Session = Depends(get_db)):
     """Update prompt rating"""
@@ -431,7 +1281,10 @@ async def rate_prompt(prompt_id: str, rating_update: PromptRatingUpdate, db: Ses
             raise HTTPException(status_code=404, detail="Prompt not found")
         
         prompt.rating = rating_update.rating
-        db.commit()
+        record_prompt_change(db, prompt_id, "upsert")
+        with span("db"):
+            db.commit()
+        prompt_change_notifier.notify()
         
         return {"message": "Rating updated successfully", "prompt_id": prompt_id, "rating": prompt.rating}
         
@@ -447,8 +1300,21 @@ async def delete_prompt(prompt_id: str, db: Session = Depends(get_db)):
         if not prompt:
             raise HTTPException(status_code=404, detail="Prompt not found")
         
+        run_ids = [run_id for (run_id,) in db.query(EvaluationRun.id).filter(EvaluationRun.prompt_id == prompt_id)]
+        await cancel_evaluations(run_ids)
+        
+        # Children first: the foreign keys have no ON DELETE CASCADE
+        if run_ids:
+            db.query(EvaluationItem).filter(EvaluationItem.run_id.in_(run_ids)).delete(synchronize_session=False)
+            db.query(EvaluationRun).filter(EvaluationRun.id.in_(run_ids)).delete(synchronize_session=False)
+        db.query(TestResult).filter(TestResult.prompt_id == prompt_id).delete(synchronize_session=False)
+        db.query(PromptTemplate).filter(PromptTemplate.prompt_id == prompt_id).delete(synchronize_session=False)
         db.delete(prompt)
-        db.commit()
+        record_prompt_change(db, prompt_id, "delete")
+        with span("db"):
+            db.commit()
+        prompt_change_notifier.notify()
+        await asyncio.to_thread(update_similarity_index, "delete", prompt_id)
         
         return {"message": "Prompt deleted successfully", "prompt_id": prompt_id}
         
@@ -471,9 +1337,10 @@ async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db
         file_path = os.path.join(upload_dir, unique_filename)
         
         # Save file
-        with open(file_path, "wb") as buffer:
+        with span("upload"):
             content = await file.read()
-            buffer.write(content)
+            with open(file_path, "wb") as buffer:
+                buffer.write(content)
         
         # Store metadata in database
         file_record = FileUpload(
@@ -484,9 +1351,10 @@ async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db
             file_path=file_path
         )
         
-        db.add(file_record)
-        db.commit()
-        db.refresh(file_record)
+        with span("db"):
+            db.add(file_record)
+            db.commit()
+            db.refresh(file_record)
         
         return {
             "id": file_record.id,
@@ -500,25 +1368,102 @@ async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db
         logger.error(f"Error in upload_file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
+# Admin Endpoints
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+class ProfileRequest(BaseModel):
+    seconds: float = 30.0
+    requests: Optional[int] = None  # Stop early after this many requests
+    interval_ms: float = 5.0
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(request: ProfileRequest):
+    """Start sampling stacks for the next N seconds or requests"""
+    if not 0 < request.seconds <= 600 or not 1 <= request.interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 600] and interval_ms in [1, 1000]")
+    if request.requests is not None and request.requests < 1:
+        raise HTTPException(status_code=400, detail="requests must be at least 1")
+    
+    try:
+        profiler.start(request.seconds, request.requests, request.interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiler.status()
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile_status():
+    """Get the state of the current or last profiling session"""
+    return profiler.status()
+
+@app.get("/api/admin/profile/download", dependencies=[Depends(require_admin)])
+async def download_profile():
+    """Download the last profile as folded stacks (flamegraph.pl / speedscope)"""
+    if profiler.running:
+        raise HTTPException(status_code=409, detail="Profiling session still running")
+    
+    return PlainTextResponse(
+        profiler.folded(),
+        headers={"Content-Disposition": "attachment; filename=profile.folded"}
+    )
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Admission queue depths and rejection counts for this worker (Prometheus text format)"""
+    return PlainTextResponse(admission.metrics(), media_type="text/plain; version=0.0.4")
+
 # Statistics Endpoint
+def token_usage_summary(db: Session, days: int = TOKEN_USAGE_DAYS) -> Dict[str, Any]:
+    """Daily per-route token rollups for the last `days` days, plus totals"""
+    rows = (
+        db.query(TokenUsageDaily)
+        .filter(TokenUsageDaily.day > date.today() - timedelta(days=days))
+        .order_by(TokenUsageDaily.day.desc(), TokenUsageDaily.route)
+        .all()
+    )
+    daily = [
+        {"day": row.day.isoformat(), "route": row.route, "requests": row.requests, "input_tokens": row.input_tokens, "output_tokens": row.output_tokens}
+        for row in rows
+    ]
+    return {
+        "days": days,
+        "daily": daily,
+        "total_requests": sum(row["requests"] for row in daily),
+        "total_input_tokens": sum(row["input_tokens"] for row in daily),
+        "total_output_tokens": sum(row["output_tokens"] for row in daily)
+    }
+
 @app.get("/api/stats")
 async def get_stats(db: Session = Depends(get_db)):
     """Get application statistics"""
     try:
+        # Short-lived snapshot shared across workers so dashboards polling this stay cheap
+        cached = get_shared_cache().get("stats:summary") if STATS_CACHE_TTL > 0 else None
+        if cached is not None:
+            return cached
+        
         total_prompts = db.query(Prompt).count()
         avg_rating = db.query(Prompt).filter(Prompt.rating > 0).with_entities(Prompt.rating).all()
         total_files = db.query(FileUpload).count()
         
         avg_rating_value = sum([rating[0] for rating in avg_rating]) / len(avg_rating) if avg_rating else 0
         
-        return {
+        stats = {
             "total_prompts": total_prompts,
             "average_rating": round(avg_rating_value, 2),
             "total_files": total_files,
             "prompts_this_week": db.query(Prompt).filter(
                 Prompt.created_at >= datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-            ).count()
+            ).count(),
+            "token_usage": token_usage_summary(db)
         }
+        if STATS_CACHE_TTL > 0:
+            get_shared_cache().set("stats:summary", stats, ttl=STATS_CACHE_TTL)
+        
+        return stats
         
     except Exception as e:
         logger.error(f"Error in get_stats: {str(e)}")
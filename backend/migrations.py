@@ -0,0 +1,125 @@
+"""
+Schema versioning for Prompt Engine
+Ordered migrations recorded in a schema_version table; a worker that finds the schema current does one query
+"""
+
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+logger = logging.getLogger(__name__)
+
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, default=datetime.utcnow),
+)
+
+
+# Helpers (idempotent, so databases created before versioning upgrade cleanly)
+
+def create_index_if_missing(connection: Connection, table: str, name: str, columns: List[str]):
+    existing = {index["name"] for index in inspect(connection).get_indexes(table)}
+    if name not in existing:
+        connection.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+
+def add_column_if_missing(connection: Connection, table: str, column: str, definition: str):
+    existing = {info["name"] for info in inspect(connection).get_columns(table)}
+    if column not in existing:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+# Migrations
+
+def _create_tables(connection: Connection, metadata: MetaData):
+    metadata.create_all(bind=connection, checkfirst=True)
+
+
+def _add_indexes(connection: Connection, metadata: MetaData):
+    # Indexes declared in schema.sql that create_all never created
+    create_index_if_missing(connection, "prompts", "idx_prompts_created_at", ["created_at"])
+    create_index_if_missing(connection, "prompts", "idx_prompts_rating", ["rating"])
+    create_index_if_missing(connection, "test_results", "idx_test_results_prompt_id", ["prompt_id"])
+    create_index_if_missing(connection, "file_uploads", "idx_file_uploads_upload_date", ["upload_date"])
+
+
+def _backfill_prompt_changes(connection: Connection, metadata: MetaData):
+    # Give prompts created before the change log existed an initial entry
+    connection.execute(text(
+        "INSERT INTO prompt_changes (prompt_id, operation, changed_at) "
+        "SELECT id, 'upsert', created_at FROM prompts "
+        "WHERE id NOT IN (SELECT prompt_id FROM prompt_changes) ORDER BY created_at"
+    ))
+
+
+def _add_token_accounting(connection: Connection, metadata: MetaData):
+    for table in ("prompts", "test_results"):
+        add_column_if_missing(connection, table, "input_tokens", "INTEGER")
+        add_column_if_missing(connection, table, "output_tokens", "INTEGER")
+        add_column_if_missing(connection, table, "tokens_estimated", "BOOLEAN")
+    metadata.tables["token_usage_daily"].create(bind=connection, checkfirst=True)
+
+
+def _add_change_sequence(connection: Connection, metadata: MetaData):
+    # prompt_changes.seq now comes from a locked counter so it is visible in commit order
+    metadata.tables["sequence_counters"].create(bind=connection, checkfirst=True)
+    connection.execute(text(
+        "INSERT INTO sequence_counters (name, value) "
+        "SELECT 'prompt_changes', COALESCE(MAX(seq), 0) FROM prompt_changes "
+        "WHERE NOT EXISTS (SELECT 1 FROM sequence_counters WHERE name = 'prompt_changes')"
+    ))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection, MetaData], None]]] = [
+    (1, "create tables", _create_tables),
+    (2, "add indexes from schema.sql", _add_indexes),
+    (3, "backfill prompt change log", _backfill_prompt_changes),
+    (4, "add token accounting", _add_token_accounting),
+    (5, "add prompt change sequence counter", _add_change_sequence),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(engine: Engine) -> int:
+    """Highest applied migration, or 0 for an unversioned database"""
+    try:
+        with engine.connect() as connection:
+            return connection.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+
+def upgrade(engine: Engine, metadata: MetaData) -> int:
+    """Apply pending migrations in order and return the resulting version.
+
+    Each migration and its schema_version row commit together. When several
+    workers boot at once, the loser of the race on a version row rolls back
+    and continues; migrations are idempotent so that is harmless on backends
+    where DDL commits implicitly.
+    """
+    version = current_version(engine)
+    if version >= LATEST_VERSION:
+        return version
+
+    version_metadata.create_all(bind=engine, checkfirst=True)
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        try:
+            with engine.begin() as connection:
+                migrate(connection, metadata)
+                connection.execute(schema_version.insert().values(version=number, description=description, applied_at=datetime.utcnow()))
+            logger.info(f"Applied migration {number}: {description}")
+        except IntegrityError:
+            logger.info(f"Migration {number} already applied by another worker")
+        version = number
+    return version
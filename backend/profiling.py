@@ -0,0 +1,196 @@
+"""
+Request timing and profiling for Prompt Engine
+Per-request stage spans reported as Server-Timing, plus an on-demand sampling profiler
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# Requests that do not end a profiling session's request budget: the admin
+# calls driving the profiler, probes, and long-lived streams
+UNCOUNTED_PATHS = re.compile(r"^/api/admin/|^/(api/health|api/metrics)?$|/stream$")
+
+# Innermost frames of threads that are parked waiting for work; sampling them
+# would bury the busy stacks under executor and event loop idle time
+IDLE_FRAMES = {
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+_current_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Accumulated milliseconds per stage for a single request"""
+    __slots__ = ("start", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, duration_ms: float):
+        self.spans[name] = self.spans.get(name, 0.0) + duration_ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+    def header_value(self) -> str:
+        entries = [f"{name};dur={duration:.1f}" for name, duration in self.spans.items()]
+        entries.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of work against the current request; a no-op outside requests.
+
+    Repeated spans with the same name add up, e.g. every DB commit in a request
+    is reported as one "db" entry.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - start) * 1000)
+
+
+class TimingMiddleware:
+    """ASGI middleware adding a Server-Timing header and logging slow requests"""
+
+    def __init__(self, app, profiler: Optional["SamplingProfiler"] = None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        event_stream = False
+
+        async def send_with_timing(message):
+            nonlocal event_stream
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                event_stream = any(name.lower() == b"content-type" and value.startswith(b"text/event-stream") for name, value in headers)
+                headers.append((b"server-timing", timings.header_value().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            total = timings.total_ms()
+            # Server-Sent Events stay open by design; their duration is not latency
+            if total >= SLOW_REQUEST_MS and not event_stream:
+                breakdown = ", ".join(f"{name}={duration:.0f}ms" for name, duration in timings.spans.items())
+                logger.warning(f"Slow request {scope['method']} {scope['path']} took {total:.0f}ms ({breakdown or 'no spans'})")
+            if self.profiler is not None and self.profiler.running:
+                self.profiler.request_finished(scope["path"])
+
+
+class SamplingProfiler:
+    """Statistical stack sampler producing folded stacks for flamegraph tools.
+
+    A background thread snapshots every busy thread's stack at a fixed interval
+    while a session is active, so the cost is bounded by the sampling rate and is
+    zero when no session is running.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self._requests_left: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, requests: Optional[int] = None, interval_ms: float = 5.0):
+        """Sample until `seconds` have passed or `requests` requests have finished"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profiling session is already running")
+            self._stacks = Counter()
+            self.samples = 0
+            self._requests_left = requests
+            self._stop.clear()
+            self.started_at = time.time()
+            self.finished_at = None
+            self._thread = threading.Thread(target=self._run, args=(seconds, interval_ms / 1000), name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def request_finished(self, path: str):
+        if UNCOUNTED_PATHS.search(path):
+            return
+        with self._lock:
+            if self._requests_left is not None:
+                self._requests_left -= 1
+                if self._requests_left <= 0:
+                    self._stop.set()
+
+    def _run(self, seconds: float, interval: float):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                with self._lock:
+                    self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+        self.finished_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "samples": self.samples,
+            "requests_left": self._requests_left,
+        }
+
+    def folded(self) -> str:
+        """Result in Brendan Gregg's folded format (flamegraph.pl, speedscope)"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
@@ -0,0 +1,80 @@
+"""
+Prompt templates for Prompt Engine
+Compiles {{variable}} templates once into a cached render plan and renders batches of variable sets
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+VARIABLE_PATTERN = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+MISSING_POLICIES = ("error", "empty", "keep")
+
+
+class RenderPlan:
+    """A template compiled to a str.format_map format string.
+
+    Literal braces are escaped and every {{name}} becomes {name}, so rendering a
+    variable set is a single C-level format_map call.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        self.variables: List[str] = []
+        pieces = []
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(template):
+            pieces.append(self._escape(template[position:match.start()]))
+            name = match.group(1)
+            pieces.append("{" + name + "}")
+            if name not in self.variables:
+                self.variables.append(name)
+            position = match.end()
+        pieces.append(self._escape(template[position:]))
+        self.format_string = "".join(pieces)
+
+    @staticmethod
+    def _escape(literal: str) -> str:
+        return literal.replace("{", "{{").replace("}", "}}")
+
+    def render_batch(self, variable_sets: List[Dict[str, Any]], missing: str = "error") -> Tuple[List[str], List[Dict[str, Any]]]:
+        """Render every variable set in one pass.
+
+        Returns the rendered outputs (None where rendering failed) and a list of
+        errors as {"index": i, "missing": [names]}. With missing="empty" or
+        "keep", absent variables render as "" or stay as {{name}}.
+        """
+        format_map = self.format_string.format_map
+        outputs = []
+        errors = []
+
+        if missing == "error":
+            for index, values in enumerate(variable_sets):
+                try:
+                    outputs.append(format_map(values))
+                except KeyError:
+                    outputs.append(None)
+                    errors.append({"index": index, "missing": [name for name in self.variables if name not in values]})
+        else:
+            fill = _EmptyFill if missing == "empty" else _KeepFill
+            for values in variable_sets:
+                outputs.append(format_map(fill(values)))
+
+        return outputs, errors
+
+
+class _EmptyFill(dict):
+    def __missing__(self, key):
+        return ""
+
+
+class _KeepFill(dict):
+    def __missing__(self, key):
+        return "{{" + key + "}}"
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> RenderPlan:
+    """Compile a template, reusing the plan for templates seen before"""
+    return RenderPlan(template)
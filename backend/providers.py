@@ -0,0 +1,292 @@
+"""
+Model providers for Prompt Engine
+Routes each endpoint to a provider/model pair, with record/replay and deterministic stub backends
+"""
+
+import os
+import abc
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+
+DEFAULT_ROUTES = {
+    "generate": {
+        "provider": "gemini",
+        "model": "gemini-1.5-pro",
+        "generationConfig": {"temperature": 0.1, "topK": 40, "topP": 0.8, "maxOutputTokens": 2048},
+        "inputTokenBudget": 4000,
+    },
+    "test": {
+        "provider": "gemini",
+        "model": "gemini-1.5-flash",
+        "generationConfig": {"temperature": 0.7, "topK": 40, "topP": 0.8, "maxOutputTokens": 1024},
+        "inputTokenBudget": 8000,
+    },
+}
+
+
+class ProviderError(Exception):
+    """A provider could not produce a completion"""
+
+
+class Completion:
+    """Text returned by a provider plus what it cost"""
+
+    def __init__(self, text: str, model: str, latency_ms: float, usage: Optional[Dict[str, int]] = None):
+        self.text = text
+        self.model = model
+        self.latency_ms = latency_ms
+        self.usage = usage  # Provider-reported token counts (Gemini usageMetadata), if any
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"text": self.text, "model": self.model, "latency_ms": self.latency_ms, "usage": self.usage}
+
+
+class ModelProvider(abc.ABC):
+    """Interface every backend implements"""
+    name = "base"
+
+    @property
+    def backend(self) -> str:
+        """Identifies who actually produces the text, for cache keys"""
+        return self.name
+
+    @abc.abstractmethod
+    async def complete(self, model: str, prompt: str, config: Dict[str, Any]) -> Completion:
+        """Return the model's response; raise ProviderError when there is none"""
+
+
+class GeminiProvider(ModelProvider):
+    """Gemini generateContent over REST"""
+    name = "gemini"
+
+    def __init__(self, api_key: str, api_url: str = GEMINI_API_URL, timeout: float = 60.0):
+        self.api_key = api_key
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+
+    @property
+    def backend(self) -> str:
+        return f"gemini@{self.api_url}"
+
+    async def complete(self, model: str, prompt: str, config: Dict[str, Any]) -> Completion:
+        start = time.perf_counter()
+        # Run the blocking HTTP call off the event loop so requests can overlap
+        response = await asyncio.to_thread(
+            requests.post,
+            f"{self.api_url}/{model}:generateContent",
+            params={"key": self.api_key},
+            json={
+                "contents": [{
+                    "parts": [{"text": prompt}]
+                }],
+                "generationConfig": config
+            },
+            timeout=self.timeout
+        )
+
+        if response.status_code != 200:
+            raise ProviderError(f"Gemini API error: {response.status_code}")
+
+        result = response.json()
+        return Completion(
+            text=result["candidates"][0]["content"]["parts"][0]["text"],
+            model=model,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            usage=result.get("usageMetadata")
+        )
+
+
+def stub_text(model: str, prompt: str) -> str:
+    """Deterministic response for a prompt: same input, same output"""
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+    if "Return a JSON object" in prompt:
+        idea = prompt.rsplit("User idea:", 1)[-1].strip().split("\n", 1)[0].strip('" ')
+        return json.dumps({
+            "persona": "You are an expert assistant specializing in software development",
+            "task": f"Help with: {idea}",
+            "constraints": ["Be clear and concise", "Provide practical examples", f"Reference {digest[:8]}"],
+            "format": "Provide a step-by-step solution with code examples",
+            "examples": ["Include error handling", "Add comments to code"]
+        })
+    words = prompt.split()
+    return f"Stub response {digest[:12]} from {model} for a {len(words)}-word prompt: " + " ".join(words[:40])
+
+
+def stub_usage(prompt: str, text: str) -> Dict[str, int]:
+    prompt_tokens = max(1, len(prompt) // 4)
+    output_tokens = max(1, len(text) // 4)
+    return {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens, "totalTokenCount": prompt_tokens + output_tokens}
+
+
+class StubProvider(ModelProvider):
+    """Local deterministic backend with a configurable, repeatable latency"""
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 0.0, ms_per_output_char: float = 0.0):
+        self.latency_ms = latency_ms
+        self.ms_per_output_char = ms_per_output_char
+
+    async def complete(self, model: str, prompt: str, config: Dict[str, Any]) -> Completion:
+        text = stub_text(model, prompt)
+        latency = self.latency_ms + self.ms_per_output_char * len(text)
+        if latency:
+            await asyncio.sleep(latency / 1000)
+        return Completion(text=text, model=model, latency_ms=latency, usage=stub_usage(prompt, text))
+
+
+def request_key(model: str, prompt: str, config: Dict[str, Any]) -> str:
+    payload = json.dumps({"model": model, "prompt": prompt, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RecordingProvider(ModelProvider):
+    """Pass-through that appends every real response to a JSONL cassette"""
+
+    def __init__(self, inner: ModelProvider, cassette_path: str):
+        self.inner = inner
+        self.name = inner.name
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(cassette_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def backend(self) -> str:
+        return self.inner.backend
+
+    async def complete(self, model: str, prompt: str, config: Dict[str, Any]) -> Completion:
+        completion = await self.inner.complete(model, prompt, config)
+        entry = {"key": request_key(model, prompt, config), "provider": self.inner.name, **completion.to_dict()}
+        with self._lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as cassette:
+                cassette.write(json.dumps(entry) + "\n")
+        return completion
+
+
+class ReplayProvider(ModelProvider):
+    """Serves recorded responses with their recorded latency; no network.
+
+    Repeated recordings of the same request are replayed in turn, cycling when
+    exhausted. `speed` scales the recorded latency (2.0 = twice as fast).
+    """
+    name = "replay"
+
+    def __init__(self, cassette_path: str, speed: float = 1.0):
+        self.speed = speed
+        self.misses = 0
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        with open(cassette_path, encoding="utf-8") as cassette:
+            for line in cassette:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+        logger.info(f"Loaded {sum(map(len, self._entries.values()))} recorded responses from {cassette_path}")
+
+    async def complete(self, model: str, prompt: str, config: Dict[str, Any]) -> Completion:
+        key = request_key(model, prompt, config)
+        recordings = self._entries.get(key)
+        if not recordings:
+            # A miss means the cassette is out of date for this code path; make it visible
+            self.misses += 1
+            logger.error(f"Replay miss #{self.misses}: no recorded response for {model} request {key[:12]} ({len(prompt)}-char prompt); re-record the cassette")
+            raise ProviderError(f"No recorded response for {model} request {key[:12]}")
+        entry = recordings[self._cursor[key] % len(recordings)]
+        self._cursor[key] += 1
+        if entry["latency_ms"] and self.speed > 0:
+            await asyncio.sleep(entry["latency_ms"] / 1000 / self.speed)
+        return Completion(text=entry["text"], model=entry["model"], latency_ms=entry["latency_ms"], usage=entry.get("usage"))
+
+
+class Route:
+    def __init__(self, name: str, provider: str, model: str, generation_config: Dict[str, Any], input_token_budget: Optional[int] = None):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.generation_config = generation_config
+        self.input_token_budget = input_token_budget  # Requests are trimmed to this many input tokens
+
+
+class ModelRouter:
+    """Maps endpoint routes ("generate", "test", "evaluate", ...) to providers and models.
+
+    Routes without their own entry fall back to "test", so cheaper or faster
+    models can be assigned per endpoint through MODEL_ROUTES alone.
+    """
+
+    def __init__(self, providers: Dict[str, ModelProvider], routes: Dict[str, Dict[str, Any]], mode: str = "live"):
+        self.providers = providers
+        self.mode = mode
+        self.routes = {}
+        for name, settings in routes.items():
+            if settings["provider"] not in providers:
+                raise ValueError(f"Route '{name}' uses unknown provider '{settings['provider']}'")
+            self.routes[name] = Route(name, settings["provider"], settings["model"], settings.get("generationConfig", {}), settings.get("inputTokenBudget"))
+
+    @property
+    def strict(self) -> bool:
+        """Record, replay and stub runs surface provider errors instead of serving canned text"""
+        return self.mode != "live"
+
+    def route(self, name: str) -> Route:
+        return self.routes.get(name) or self.routes["test"]
+
+    def cache_namespace(self, route_name: str) -> str:
+        """Backend, model and generation settings behind a route; equal only when outputs are interchangeable"""
+        route = self.route(route_name)
+        config = json.dumps(route.generation_config, sort_keys=True)
+        return f"{self.providers[route.provider].backend}:{route.model}:{hashlib.sha256(config.encode()).hexdigest()[:16]}"
+
+    async def complete(self, route_name: str, prompt: str) -> Completion:
+        route = self.route(route_name)
+        return await self.providers[route.provider].complete(route.model, prompt, route.generation_config)
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """Build the router from environment settings.
+
+        MODEL_PROVIDER_MODE: live (default), record, replay or stub
+        MODEL_ROUTES: JSON overriding DEFAULT_ROUTES per route (generationConfig is merged key by key)
+        MODEL_CASSETTE: cassette file for record/replay
+        """
+        mode = os.getenv("MODEL_PROVIDER_MODE", "live").lower()
+        routes = {name: dict(settings) for name, settings in DEFAULT_ROUTES.items()}
+        for name, settings in json.loads(os.getenv("MODEL_ROUTES", "{}")).items():
+            base = routes.get(name, routes["test"])
+            routes[name] = {**base, **settings, "generationConfig": {**base["generationConfig"], **settings.get("generationConfig", {})}}
+
+        stub = StubProvider(float(os.getenv("STUB_LATENCY_MS", "0")), float(os.getenv("STUB_MS_PER_CHAR", "0")))
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key:
+            gemini = GeminiProvider(api_key, os.getenv("GEMINI_API_URL", GEMINI_API_URL))
+        else:
+            logger.warning("GEMINI_API_KEY not found. Routing Gemini traffic to the local stub provider.")
+            gemini = stub
+        providers: Dict[str, ModelProvider] = {"gemini": gemini, "stub": stub}
+
+        cassette_path = os.getenv("MODEL_CASSETTE", os.path.join(os.getcwd(), "cassettes", "model_responses.jsonl"))
+        if mode == "record":
+            providers = {name: RecordingProvider(provider, cassette_path) for name, provider in providers.items()}
+        elif mode == "replay":
+            replay = ReplayProvider(cassette_path, float(os.getenv("REPLAY_SPEED", "1.0")))
+            providers = {name: replay for name in providers}
+        elif mode == "stub":
+            providers = {name: stub for name in providers}
+        elif mode != "live":
+            raise ValueError(f"Unknown MODEL_PROVIDER_MODE '{mode}'")
+
+        logger.info(f"Model provider mode: {mode}; routes: " + ", ".join(f"{name}={route['provider']}:{route['model']}" for name, route in routes.items()))
+        return cls(providers, routes, mode)
@@ -14,7 +14,10 @@ CREATE TABLE IF NOT EXISTS prompts (
     generated_prompt_text TEXT NOT NULL,
     rating INT DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    context_files JSON NULL
+    context_files JSON NULL,
+    input_tokens INT NULL,
+    output_tokens INT NULL,
+    tokens_estimated BOOLEAN NULL
 );
 
 -- Test results table
@@ -24,9 +27,80 @@ CREATE TABLE IF NOT EXISTS test_results (
     test_input TEXT NOT NULL,
     test_output MEDIUMTEXT NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    input_tokens INT NULL,
+    output_tokens INT NULL,
+    tokens_estimated BOOLEAN NULL,
     FOREIGN KEY (prompt_id) REFERENCES prompts(id) ON DELETE CASCADE
 );
 
+-- Prompt templates ({{variable}} placeholders)
+CREATE TABLE IF NOT EXISTS prompt_templates (
+    prompt_id VARCHAR(36) PRIMARY KEY,
+    template_text MEDIUMTEXT NOT NULL,
+    variables JSON NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    FOREIGN KEY (prompt_id) REFERENCES prompts(id) ON DELETE CASCADE
+);
+
+-- Evaluation runs (a prompt run against a dataset of test inputs)
+CREATE TABLE IF NOT EXISTS evaluation_runs (
+    id VARCHAR(36) PRIMARY KEY,
+    prompt_id VARCHAR(36) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    inputs JSON NOT NULL,
+    assertions JSON NULL,
+    concurrency INT NOT NULL DEFAULT 4,
+    total INT NOT NULL,
+    completed INT NOT NULL DEFAULT 0,
+    summary JSON NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at TIMESTAMP NULL,
+    finished_at TIMESTAMP NULL,
+    FOREIGN KEY (prompt_id) REFERENCES prompts(id) ON DELETE CASCADE
+);
+
+-- Evaluation items (links each run input to its stored test result)
+CREATE TABLE IF NOT EXISTS evaluation_items (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    run_id VARCHAR(36) NOT NULL,
+    input_index INT NOT NULL,
+    test_result_id INT NOT NULL,
+    latency_ms DOUBLE NOT NULL,
+    FOREIGN KEY (run_id) REFERENCES evaluation_runs(id) ON DELETE CASCADE,
+    FOREIGN KEY (test_result_id) REFERENCES test_results(id) ON DELETE CASCADE
+);
+
+-- Prompt change log (one row per prompt, deletes kept as tombstones)
+CREATE TABLE IF NOT EXISTS prompt_changes (
+    seq INT AUTO_INCREMENT PRIMARY KEY,
+    prompt_id VARCHAR(36) NOT NULL,
+    operation VARCHAR(10) NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Daily token usage per model route
+CREATE TABLE IF NOT EXISTS token_usage_daily (
+    day DATE NOT NULL,
+    route VARCHAR(20) NOT NULL,
+    requests INT NOT NULL DEFAULT 0,
+    input_tokens INT NOT NULL DEFAULT 0,
+    output_tokens INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, route)
+);
+
+-- Named counters (prompt_changes.seq is taken from here so it is visible in commit order)
+CREATE TABLE IF NOT EXISTS sequence_counters (
+    name VARCHAR(50) PRIMARY KEY,
+    value INT NOT NULL DEFAULT 0
+);
+
+-- Schema version (migrations.py records each applied migration here)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INT PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- File uploads table
 CREATE TABLE IF NOT EXISTS file_uploads (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -42,6 +116,9 @@ CREATE TABLE IF NOT EXISTS file_uploads (
 CREATE INDEX idx_prompts_created_at ON prompts(created_at);
 CREATE INDEX idx_prompts_rating ON prompts(rating);
 CREATE INDEX idx_test_results_prompt_id ON test_results(prompt_id);
+CREATE INDEX idx_evaluation_runs_prompt_id ON evaluation_runs(prompt_id);
+CREATE INDEX idx_evaluation_items_run_id ON evaluation_items(run_id);
+CREATE INDEX idx_prompt_changes_prompt_id ON prompt_changes(prompt_id);
 CREATE INDEX idx_file_uploads_upload_date ON file_uploads(upload_date);
 
 -- Insert sample data
@@ -0,0 +1,158 @@
+"""
+Shared cache for Prompt Engine
+A size-bounded key/value cache in a SQLite WAL file, shared by every worker process on a node
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache(accessed_at);
+CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY CHECK (id = 1), total_size INTEGER NOT NULL);
+INSERT OR IGNORE INTO cache_meta (id, total_size) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache
+    BEGIN UPDATE cache_meta SET total_size = total_size + NEW.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache
+    BEGIN UPDATE cache_meta SET total_size = total_size + NEW.size - OLD.size WHERE id = 1; END;
+CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache
+    BEGIN UPDATE cache_meta SET total_size = total_size - OLD.size WHERE id = 1; END;
+"""
+
+# Up to 64 least recently used entries, stopping once `excess` bytes are freed
+_EVICT_BATCH = """
+DELETE FROM cache WHERE key IN (
+    SELECT key FROM (
+        SELECT key, SUM(size) OVER (ORDER BY accessed_at, key ROWS UNBOUNDED PRECEDING) - size AS freed_before
+        FROM (SELECT key, size, accessed_at FROM cache ORDER BY accessed_at LIMIT 64)
+    ) WHERE freed_before < ?
+)
+"""
+
+# Reads only rewrite accessed_at when it is older than this, keeping hits read-only
+_TOUCH_INTERVAL = 5.0
+
+
+class SharedCache:
+    """JSON values keyed by string, evicted least-recently-used past max_bytes.
+
+    SQLite in WAL mode lets readers in all workers proceed concurrently with a
+    single writer, so the file behaves as a node-local cache service. Keys are
+    namespaced by prefix, e.g. "gen:", "file:", "stats:".
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None when missing or expired"""
+        try:
+            connection = self._connection()
+            row = connection.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return None
+            if now - row[2] > _TOUCH_INTERVAL:
+                connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a JSON-serializable value, evicting old entries if over budget"""
+        payload = json.dumps(value).encode()
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            connection = self._connection()
+            connection.execute(
+                "INSERT INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, payload, len(payload), now + ttl if ttl else None, now)
+            )
+            total = connection.execute("SELECT total_size FROM cache_meta WHERE id = 1").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(connection, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {e}")
+
+    def _evict(self, connection: sqlite3.Connection, now: float):
+        # Drop expired entries first, then least recently used down to 90% of the budget
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            target = int(self.max_bytes * 0.9)
+            while True:
+                excess = connection.execute("SELECT total_size FROM cache_meta WHERE id = 1").fetchone()[0] - target
+                if excess <= 0:
+                    break
+                deleted = connection.execute(_EVICT_BATCH, (excess,)).rowcount
+                if not deleted:
+                    # Empty cache but a nonzero total: the counter drifted, so recount instead of spinning
+                    connection.execute("UPDATE cache_meta SET total_size = (SELECT COALESCE(SUM(size), 0) FROM cache) WHERE id = 1")
+                    break
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, key: str):
+        try:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache delete failed: {e}")
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        connection = self._connection()
+        entries = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        total = connection.execute("SELECT total_size FROM cache_meta WHERE id = 1").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
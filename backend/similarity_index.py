@@ -0,0 +1,359 @@
+"""
+Local similarity index for Prompt Engine
+Hashed TF-IDF vectors kept in a memory-mapped matrix, scored with NumPy
+"""
+
+import os
+import re
+import json
+import uuid
+import zlib
+import shutil
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word unigrams plus bigrams"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class SimilarityIndex:
+    """Append-only matrix of L2-normalized hashed term-frequency vectors.
+
+    Rows are written in place as prompts are generated and zeroed when they are
+    deleted; the matrix is compacted once enough rows are dead. IDF weights are
+    derived from per-bucket document frequencies at query time, so appending a
+    row never requires re-weighting the others.
+
+    Several worker processes may share one directory. Writers hold an exclusive
+    file lock and readers a shared one, and every operation reloads meta.json
+    under the lock, so no process keeps row positions of its own. Full rebuilds
+    are written to a side directory and swapped in, so they never hold the lock
+    for longer than a rename.
+    """
+
+    def __init__(self, directory: str, dim: int = 256, initial_capacity: int = 1024):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._ids_path = os.path.join(directory, "ids.s36")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._build_lock_path = os.path.join(directory, "rebuild.lock")
+        os.makedirs(directory, exist_ok=True)
+        self.capacity = 0  # Rows currently mapped in this process
+        self._epoch = None  # Changes whenever the files are swapped, so other processes remap
+
+        with self._locked(exclusive=True):
+            meta = self._load_meta()
+            if meta and meta["dim"] == dim:
+                self._apply_meta(meta)
+            else:
+                if meta:
+                    logger.info(f"Similarity index dimension changed ({meta['dim']} -> {dim}), starting empty")
+                self.count = 0
+                self.df = np.zeros(dim, dtype=np.int64)
+                self._synced_seq = None
+                self._epoch = uuid.uuid4().hex
+                self._map_files(initial_capacity)
+                self._vectors[:] = 0
+                self._id_array[:] = b""
+                self._save_meta()
+
+    # Storage
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_meta(self) -> Optional[dict]:
+        try:
+            with open(self._meta_path) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _apply_meta(self, meta: dict):
+        self.count = meta["count"]
+        self.df = np.array(meta["df"], dtype=np.int64)
+        self._synced_seq = meta.get("synced_seq")
+        if meta["capacity"] != self.capacity or meta.get("epoch") != self._epoch:
+            self._map_files(meta["capacity"])
+            self._epoch = meta.get("epoch")
+
+    def _refresh(self):
+        # Another worker may have appended, compacted or grown the files since our last call
+        meta = self._load_meta()
+        if meta is not None:
+            self._apply_meta(meta)
+
+    def _save_meta(self):
+        self._vectors.flush()
+        self._id_array.flush()
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump({
+                "dim": self.dim, "count": self.count, "capacity": self.capacity, "df": self.df.tolist(),
+                "epoch": self._epoch, "synced_seq": self._synced_seq,
+            }, meta_file)
+        os.replace(tmp_path, self._meta_path)
+
+    def _map_files(self, capacity: int):
+        if self.capacity:
+            self._vectors.flush()
+            self._id_array.flush()
+            del self._vectors, self._id_array
+        for path, row_bytes in ((self._vectors_path, self.dim * 4), (self._ids_path, 36)):
+            with open(path, "ab") as handle:
+                if handle.tell() < capacity * row_bytes:
+                    handle.truncate(capacity * row_bytes)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._id_array = np.memmap(self._ids_path, dtype="S36", mode="r+", shape=(capacity,))
+        self.capacity = capacity
+
+    def _grow(self, needed: int):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self._map_files(capacity)
+
+    def _live(self) -> np.ndarray:
+        return self._id_array[:self.count] != b""
+
+    # Vectorization
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """Signed feature hashing with sublinear term frequency"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = tokenize(text)
+        if not tokens:
+            return vector
+        hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens), dtype=np.uint32, count=len(tokens))
+        buckets, counts = np.unique(hashes, return_counts=True)
+        signs = np.where(buckets & 0x80000000, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, (buckets % self.dim).astype(np.intp), signs * (1.0 + np.log(counts)).astype(np.float32))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _query_vector(self, text: str, live_rows: int) -> np.ndarray:
+        live_rows = max(live_rows, 1)
+        idf = np.log((1.0 + live_rows) / (1.0 + self.df)) + 1.0
+        query = self.vectorize(text) * (idf * idf).astype(np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    # Mutation
+
+    def add(self, prompt_id: str, text: str):
+        """Insert or replace the vector for a prompt"""
+        self.add_many([(prompt_id, text)])
+
+    def add_many(self, items: Iterable[Tuple[str, str]]):
+        """Insert or replace vectors for many prompts with a single flush"""
+        items = list(items)
+        if not items:
+            return
+        vectors = np.vstack([self.vectorize(text) for _, text in items])
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._write(items, vectors, replace=True)
+            self._save_meta()
+
+    def _write(self, items: List[Tuple[str, str]], vectors: np.ndarray, replace: bool):
+        positions = {}
+        if replace and self.count:
+            ids = self._id_array[:self.count]
+            wanted = np.array([prompt_id.encode() for prompt_id, _ in items], dtype="S36")
+            positions = {ids[i].decode(): int(i) for i in np.flatnonzero(np.isin(ids, wanted))}
+        for (prompt_id, _), vector in zip(items, vectors):
+            position = positions.get(prompt_id)
+            if position is None:
+                if self.count == self.capacity:
+                    self._grow(self.count + 1)
+                position = self.count
+                self.count += 1
+                self._id_array[position] = prompt_id.encode()
+                positions[prompt_id] = position
+            else:
+                self.df -= self._vectors[position] != 0
+            self._vectors[position] = vector
+            self.df += vector != 0
+
+    def remove(self, prompt_id: str):
+        """Drop a prompt's row, compacting the matrix when a quarter of it is dead"""
+        with self._locked(exclusive=True):
+            self._refresh()
+            if self._remove(prompt_id):
+                self._maybe_compact()
+                self._save_meta()
+
+    def apply_changes(self, upserts: List[Tuple[str, str]], deletes: List[str], seq: int):
+        """Apply a batch of change-feed entries and record `seq` as synced.
+
+        Entries may already have been applied by the request that made them,
+        so upserts replace rows and deletes of missing rows are ignored.
+        """
+        vectors = np.vstack([self.vectorize(text) for _, text in upserts]) if upserts else None
+        with self._locked(exclusive=True):
+            self._refresh()
+            if upserts:
+                self._write(upserts, vectors, replace=True)
+            if sum(self._remove(prompt_id) for prompt_id in deletes):
+                self._maybe_compact()
+            self._synced_seq = max(self._synced_seq or 0, seq)
+            self._save_meta()
+
+    def synced_seq(self) -> Optional[int]:
+        """Last change-feed sequence number applied, or None if the index was never synced"""
+        with self._locked(exclusive=False):
+            self._refresh()
+            return self._synced_seq
+
+    def _remove(self, prompt_id: str) -> bool:
+        matches = np.flatnonzero(self._id_array[:self.count] == prompt_id.encode())
+        for position in matches:
+            self.df -= self._vectors[position] != 0
+            self._vectors[position] = 0
+            self._id_array[position] = b""
+        return bool(len(matches))
+
+    def _maybe_compact(self):
+        dead = self.count - int(np.count_nonzero(self._live()))
+        if dead >= 64 and dead * 4 >= self.count:
+            self._compact()
+
+    def _compact(self, chunk_rows: int = 65536):
+        # Live rows only ever move towards the front, so chunks can be copied in place
+        write = 0
+        for start in range(0, self.count, chunk_rows):
+            end = min(start + chunk_rows, self.count)
+            live = self._id_array[start:end] != b""
+            rows = self._vectors[start:end][live]
+            ids = self._id_array[start:end][live]
+            self._vectors[write:write + len(rows)] = rows
+            self._id_array[write:write + len(ids)] = ids
+            write += len(rows)
+        self._vectors[write:self.count] = 0
+        self._id_array[write:self.count] = b""
+        logger.info(f"Compacted similarity index from {self.count} to {write} rows")
+        self.count = write
+
+    @contextmanager
+    def _build_lock(self):
+        # Non-blocking: when another process is already rebuilding, this one skips
+        if fcntl is None:
+            yield True
+            return
+        with open(self._build_lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def rebuild(self, items: Iterable[Tuple[str, str]], seq: Optional[int] = None, batch_size: int = 1000) -> bool:
+        """Replace the whole index with the given (prompt_id, text) pairs, synced up to `seq`.
+
+        The new index is built in a side directory without holding the index
+        lock, then its files are renamed over the live ones. Returns False if
+        another process is already rebuilding.
+        """
+        with self._build_lock() as acquired:
+            if not acquired:
+                return False
+            if fcntl is None:
+                # Memory-mapped files cannot be renamed over on Windows; rebuild in place
+                with self._locked(exclusive=True):
+                    self._refresh()
+                    self._rebuild(items, batch_size)
+                    self._synced_seq = seq
+                    self._save_meta()
+                return True
+
+            build_directory = tempfile.mkdtemp(prefix=".rebuild-", dir=self.directory)
+            try:
+                staged = SimilarityIndex(build_directory, self.dim)
+                staged._rebuild(items, batch_size)
+                staged._synced_seq = seq
+                staged._save_meta()
+                with self._locked(exclusive=True):
+                    # meta.json goes last: it names the new epoch, telling every process to remap
+                    os.replace(staged._vectors_path, self._vectors_path)
+                    os.replace(staged._ids_path, self._ids_path)
+                    os.replace(staged._meta_path, self._meta_path)
+                    self._refresh()
+                del staged
+            finally:
+                shutil.rmtree(build_directory, ignore_errors=True)
+            return True
+
+    def _rebuild(self, items: Iterable[Tuple[str, str]], batch_size: int = 1000):
+        self._vectors[:self.count] = 0
+        self._id_array[:self.count] = b""
+        self.df[:] = 0
+        self.count = 0
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self._write(batch, np.vstack([self.vectorize(text) for _, text in batch]), replace=False)
+                batch = []
+        if batch:
+            self._write(batch, np.vstack([self.vectorize(text) for _, text in batch]), replace=False)
+        self._save_meta()
+
+    def __len__(self) -> int:
+        with self._locked(exclusive=False):
+            self._refresh()
+            return int(np.count_nonzero(self._live()))
+
+    # Search
+
+    def search(self, text: str, k: int = 10, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Return up to k (prompt_id, score) pairs ordered by cosine similarity"""
+        with self._locked(exclusive=False):
+            self._refresh()
+            ids = self._id_array[:self.count]
+            live = ids != b""
+            live_rows = int(np.count_nonzero(live))
+            query = self._query_vector(text, live_rows)
+            if not live_rows or not query.any():
+                return []
+            scores = self._vectors[:self.count] @ query
+            scores[~live] = -np.inf
+            if exclude is not None:
+                scores[ids == exclude.encode()] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(ids[i].decode(), float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,74 @@
+"""
+Deterministic local stand-in for the Gemini REST API
+Point GEMINI_API_URL at it for realistic, network-free load and latency testing:
+
+    python stub_server.py --port 8089 --latency-ms 400
+    GEMINI_API_URL=http://127.0.0.1:8089/v1beta/models GEMINI_API_KEY=stub python main.py
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from providers import stub_text, stub_usage
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    latency_ms = 0.0
+    ms_per_output_char = 0.0
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if not path.endswith(":generateContent"):
+            self._send(404, {"error": {"code": 404, "message": f"Unknown path {path}"}})
+            return
+
+        model = path.rsplit("/", 1)[-1].split(":", 1)[0]
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+
+        text = stub_text(model, prompt)
+        delay = self.latency_ms + self.ms_per_output_char * len(text)
+        if delay:
+            time.sleep(delay / 1000)
+
+        self._send(200, {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": stub_usage(prompt, text),
+            "modelVersion": model
+        })
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic Gemini API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed delay per request")
+    parser.add_argument("--ms-per-char", type=float, default=0.0, help="Extra delay per output character")
+    args = parser.parse_args()
+
+    StubGeminiHandler.latency_ms = args.latency_ms
+    StubGeminiHandler.ms_per_output_char = args.ms_per_char
+    server = ThreadingHTTPServer((args.host, args.port), StubGeminiHandler)
+    print(f"Stub Gemini API on http://{args.host}:{args.port}/v1beta/models")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Admission control tests: classification, shedding, priorities, cancellation and quotas
+"""
+
+import json
+import asyncio
+
+from admission import AdmissionController, AdmissionMiddleware, ClientQuotas, Rejected, classify, client_key
+
+
+def make_controller(max_concurrency=4, rate=0.0, burst=0.0, api_keys=(), **overrides):
+    classes = {
+        "interactive": {"priority": 0, "concurrency": 4, "queue": 4, "timeout": 1.0, "cost": 1},
+        "standard": {"priority": 1, "concurrency": 4, "queue": 4, "timeout": 1.0, "cost": 1},
+        "bulk": {"priority": 2, "concurrency": 1, "queue": 1, "timeout": 1.0, "cost": 5},
+    }
+    for name, settings in overrides.items():
+        classes[name].update(settings)
+    return AdmissionController(classes, max_concurrency, ClientQuotas(rate, burst), api_keys)
+
+
+def test_classify():
+    assert classify("GET", "/api/health") == "exempt"
+    assert classify("GET", "/api/prompts/changes/stream") == "exempt"
+    assert classify("GET", "/api/prompts") == "interactive"
+    assert classify("HEAD", "/api/stats") == "interactive"
+    assert classify("POST", "/api/generate") == "bulk"
+    assert classify("POST", "/api/prompts/abc/evaluate") == "bulk"
+    assert classify("PUT", "/api/prompts/abc/template") == "standard"
+
+
+def test_sheds_when_queue_full():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire("bulk")  # Holds the only bulk slot
+        queued = asyncio.create_task(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire("bulk")
+            raise AssertionError("third bulk request should have been shed")
+        except Rejected as rejected:
+            assert rejected.status == 503 and rejected.reason == "queue_full"
+            assert rejected.retry_after >= 1
+        controller.release("bulk", 10.0)
+        await queued
+        assert controller.classes["bulk"].rejected["queue_full"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_sheds_after_queue_deadline():
+    async def scenario():
+        controller = make_controller(bulk={"timeout": 0.05})
+        await controller.acquire("bulk")
+        try:
+            await controller.acquire("bulk")
+            raise AssertionError("queued bulk request should have missed its deadline")
+        except Rejected as rejected:
+            assert rejected.reason == "deadline"
+        assert len(controller.classes["bulk"].waiters) == 0
+
+    asyncio.run(scenario())
+
+
+def test_interactive_overtakes_queued_bulk():
+    async def scenario():
+        controller = make_controller(max_concurrency=1, bulk={"queue": 4})
+        order = []
+
+        async def request(class_name):
+            await controller.acquire(class_name)
+            order.append(class_name)
+
+        await controller.acquire("bulk")
+        bulk = asyncio.create_task(request("bulk"))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("interactive"))
+        await asyncio.sleep(0)
+        assert order == []
+
+        controller.release("bulk", 10.0)
+        await interactive
+        assert order == ["interactive"] and not bulk.done()
+        controller.release("interactive", 1.0)
+        await bulk
+        assert order == ["interactive", "bulk"]
+
+    asyncio.run(scenario())
+
+
+def test_cancel_while_queued_frees_queue_position():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire("bulk")
+        queued = asyncio.create_task(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        assert len(controller.classes["bulk"].waiters) == 1
+
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert len(controller.classes["bulk"].waiters) == 0
+
+        controller.release("bulk", 10.0)
+        assert controller.active == 0 and controller.classes["bulk"].active == 0
+        await controller.acquire("bulk")  # The slot is free again, not leaked to the cancelled waiter
+
+    asyncio.run(scenario())
+
+
+def test_cancel_after_grant_releases_slot():
+    async def scenario():
+        controller = make_controller()
+        await controller.acquire("bulk")
+        queued = asyncio.create_task(controller.acquire("bulk"))
+        await asyncio.sleep(0)
+        controller.release("bulk", 10.0)  # Hands the slot to the waiter...
+        queued.cancel()  # ...whose client disconnects before it resumes
+        await asyncio.gather(queued, return_exceptions=True)
+        assert controller.active == 0 and controller.classes["bulk"].active == 0
+
+    asyncio.run(scenario())
+
+
+def test_quota_refunded_when_shed():
+    async def scenario():
+        controller = make_controller(rate=0.001, burst=5)
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"{\"detail\": \"ok\"}"})
+
+        middleware = AdmissionMiddleware(app, controller)
+        scope = {"type": "http", "method": "POST", "path": "/api/generate", "headers": [(b"x-api-key", b"client")], "client": ("127.0.0.1", 1)}
+        responses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                responses.append(message["status"])
+            else:
+                responses[-1] = (responses[-1], json.loads(message["body"])["detail"])
+
+        # Another client fills the single bulk slot and queue, so this client is shed
+        await controller.acquire("bulk")
+        controller.classes["bulk"].waiters.append(asyncio.get_running_loop().create_future())
+        await middleware(scope, None, send)
+        assert responses[-1][0] == 503
+
+        # The shed request cost nothing, so the retry is admitted rather than hitting 429
+        controller.classes["bulk"].waiters.clear()
+        controller.release("bulk", 10.0)
+        await middleware(scope, None, send)
+        assert responses[-1] == (200, "ok"), responses
+        assert controller.classes["bulk"].rejected["quota"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_quota_exhausted_returns_429():
+    async def scenario():
+        controller = make_controller(rate=0.001, burst=5)
+        controller.check_quota("bulk", "client")
+        try:
+            controller.check_quota("bulk", "client")
+            raise AssertionError("second bulk request should exceed the quota")
+        except Rejected as rejected:
+            assert rejected.status == 429 and rejected.retry_after >= 1
+
+    asyncio.run(scenario())
+
+
+
+def test_only_known_api_keys_identify_clients():
+    def scope(api_key=None, ip="10.0.0.1"):
+        headers = [(b"x-api-key", api_key.encode())] if api_key else []
+        return {"type": "http", "method": "POST", "path": "/api/generate", "headers": headers, "client": (ip, 1)}
+
+    api_keys = frozenset({"team-a"})
+    assert client_key(scope("team-a"), api_keys) == "key:team-a"
+    assert client_key(scope("made-up"), api_keys) == "ip:10.0.0.1"
+    assert client_key(scope(), api_keys) == "ip:10.0.0.1"
+    assert client_key(scope("team-a")) == "ip:10.0.0.1"  # No allow-list: keys are ignored
+
+    async def scenario():
+        controller = make_controller(rate=0.001, burst=5, api_keys=api_keys)
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = AdmissionMiddleware(app, controller)
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        # A fresh made-up key per request still draws on the caller's IP quota
+        await middleware(scope("made-up-1"), None, send)
+        await middleware(scope("made-up-2"), None, send)
+        await middleware(scope("team-a"), None, send)  # Known key: separate bucket
+        assert statuses == [200, 429, 200]
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+"""
+Change feed tests: sequence ordering, one row per prompt, paging and client sync
+"""
+
+import threading
+
+from sqlalchemy import func
+
+import api_client
+import main
+from api_client import PromptEngineAPI
+
+
+def latest_seq(db) -> int:
+    db.expire_all()
+    return db.query(func.max(main.PromptChange.seq)).scalar() or 0
+
+
+def generate(client, idea: str) -> str:
+    response = client.post("/api/generate", json={"idea": idea})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_sequence_follows_insert_rate_delete(client, db):
+    since = latest_seq(db)
+    kept = generate(client, "summarize meeting notes")
+    deleted = generate(client, "write a haiku about rain")
+    assert client.post(f"/api/prompts/{kept}/rate", json={"rating": 1}).status_code == 200
+    assert client.delete(f"/api/prompts/{deleted}").status_code == 200
+
+    feed = client.get("/api/prompts/changes", params={"since": since}).json()
+    seqs = [change["seq"] for change in feed["changes"]]
+    assert seqs == sorted(seqs) and len(set(seqs)) == len(seqs)
+    # One entry per prompt holding its latest change; the deleted prompt remains as a tombstone
+    assert [(change["prompt_id"], change["operation"]) for change in feed["changes"]] == [(kept, "upsert"), (deleted, "delete")]
+    assert feed["changes"][0]["prompt"]["rating"] == 1
+    assert feed["changes"][1]["prompt"] is None
+    assert feed["last_seq"] == seqs[-1] and not feed["has_more"]
+
+    for prompt_id in (kept, deleted):
+        assert db.query(main.PromptChange).filter(main.PromptChange.prompt_id == prompt_id).count() == 1
+
+
+def test_paging_reports_has_more(client, db):
+    since = latest_seq(db)
+    ids = [generate(client, f"paging prompt {i}") for i in range(3)]
+
+    seen = []
+    pages = 0
+    while True:
+        feed = client.get("/api/prompts/changes", params={"since": since, "limit": 2}).json()
+        seen += [change["prompt_id"] for change in feed["changes"]]
+        since = feed["last_seq"]
+        pages += 1
+        if not feed["has_more"]:
+            break
+    assert seen == ids and pages == 2
+
+
+def test_sync_prompts_applies_deltas(client, db, monkeypatch):
+    monkeypatch.setattr(api_client, "requests", client)  # TestClient speaks the requests API
+    api = PromptEngineAPI(str(client.base_url))
+
+    local = {}
+    since = api.sync_prompts(local)
+    assert set(local) == {prompt_id for (prompt_id,) in db.query(main.Prompt.id).all()}
+
+    added = generate(client, "explain recursion to a child")
+    removed = next(iter(local))
+    client.delete(f"/api/prompts/{removed}")
+    client.post(f"/api/prompts/{added}/rate", json={"rating": 2})
+
+    since = api.sync_prompts(local, since)
+    assert added in local and removed not in local
+    assert local[added]["rating"] == 2
+    assert since == latest_seq(db)
+
+
+def test_concurrent_writers_get_distinct_increasing_seqs(client, db):
+    ids = [generate(client, f"concurrent prompt {i}") for i in range(4)]
+    before = latest_seq(db)
+
+    def rate_repeatedly(prompt_id):
+        for _ in range(10):
+            session = main.SessionLocal()
+            try:
+                main.record_prompt_change(session, prompt_id, "upsert")
+                session.commit()
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=rate_repeatedly, args=(prompt_id,)) for prompt_id in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counter = db.query(main.SequenceCounter.value).filter(main.SequenceCounter.name == "prompt_changes").scalar()
+    assert counter == before + 40 == latest_seq(db)
@@ -0,0 +1,89 @@
+"""
+Evaluation run tests: resuming an interrupted run and deleting a prompt mid-run
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import main
+
+
+def fake_model(monkeypatch, delay: float = 0.0):
+    """Replace the model call with an echo; returns the list of prompts it was sent"""
+    calls = []
+
+    async def test_prompt_with_usage(prompt, route="test"):
+        calls.append(prompt)
+        await asyncio.sleep(delay)
+        return f"answer to {prompt.rsplit(chr(10), 1)[-1]}", None
+
+    monkeypatch.setattr(main.get_ai_service(), "test_prompt_with_usage", test_prompt_with_usage)
+    return calls
+
+
+def new_prompt(db) -> main.Prompt:
+    prompt = main.Prompt(original_idea="grade an essay", generated_prompt_json="{}", generated_prompt_text="You grade essays")
+    db.add(prompt)
+    db.commit()
+    return prompt
+
+
+def test_resume_runs_only_remaining_inputs(db, monkeypatch):
+    prompt = new_prompt(db)
+    inputs = [f"essay {i}" for i in range(5)]
+    run = main.EvaluationRun(
+        prompt_id=prompt.id, inputs=inputs, assertions=[{"type": "contains", "value": "answer"}],
+        concurrency=2, total=len(inputs), completed=2, status="running",
+        heartbeat_at=datetime.utcnow() - timedelta(seconds=main.EVAL_STALE_SECONDS + 60)
+    )
+    db.add(run)
+    db.flush()
+    for index in (0, 3):  # Written by the worker that died
+        result = main.TestResult(prompt_id=prompt.id, test_input=inputs[index], test_output=f"answer to {inputs[index]}")
+        db.add(result)
+        db.flush()
+        db.add(main.EvaluationItem(run_id=run.id, input_index=index, test_result_id=result.id, latency_ms=10.0))
+    db.commit()
+
+    assert run.id in main.claim_stale_evaluations(db)
+    assert run.id not in main.claim_stale_evaluations(db)  # The heartbeat was refreshed by the claim
+
+    calls = fake_model(monkeypatch)
+    notifications = []
+    monkeypatch.setattr(main, "EVAL_WRITE_BATCH", 2)
+    monkeypatch.setattr(main.evaluation_notifier, "notify", lambda: notifications.append(True))
+    asyncio.run(main.run_evaluation(run.id))
+
+    assert sorted(call.rsplit("\n", 1)[-1] for call in calls) == ["essay 1", "essay 2", "essay 4"]
+    # Two batches (2 + 1 results) plus the final notification
+    assert len(notifications) == 3
+    db.expire_all()
+    run = db.query(main.EvaluationRun).filter(main.EvaluationRun.id == run.id).one()
+    assert run.status == "completed" and run.completed == 5
+    assert run.summary["count"] == 5 and run.summary["pass_rate"] == 1.0
+    indexes = [index for (index,) in db.query(main.EvaluationItem.input_index).filter(main.EvaluationItem.run_id == run.id)]
+    assert sorted(indexes) == list(range(5))
+
+
+def test_delete_prompt_cancels_and_removes_evaluations(client, db, monkeypatch):
+    prompt_id = new_prompt(db).id
+    fake_model(monkeypatch, delay=0.05)
+    response = client.post(f"/api/prompts/{prompt_id}/evaluate", json={"inputs": [f"essay {i}" for i in range(40)], "concurrency": 1})
+    assert response.status_code == 200
+    run_id = response.json()["id"]
+
+    deadline = time.monotonic() + 10
+    while client.get(f"/api/evaluations/{run_id}").json()["completed"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert client.delete(f"/api/prompts/{prompt_id}").status_code == 200
+    assert run_id not in main.evaluation_tasks
+    assert client.get(f"/api/evaluations/{run_id}").status_code == 404
+    db.expire_all()
+    assert db.query(main.TestResult).filter(main.TestResult.prompt_id == prompt_id).count() == 0
+    assert db.query(main.EvaluationItem).filter(main.EvaluationItem.run_id == run_id).count() == 0
+    # No rows left pointing at deleted parents, as a database enforcing foreign keys would require
+    assert db.execute(text("PRAGMA foreign_key_check")).fetchall() == []
@@ -0,0 +1,73 @@
+"""
+Schema migration tests: fresh databases, pre-versioning upgrades and the up-to-date fast path
+"""
+
+import os
+import tempfile
+
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+from main import Base
+
+# Tables as created by create_all before the schema was versioned
+LEGACY_SCHEMA = [
+    """CREATE TABLE prompts (
+        id VARCHAR(36) PRIMARY KEY, original_idea TEXT NOT NULL, generated_prompt_json TEXT NOT NULL,
+        generated_prompt_text TEXT NOT NULL, rating INTEGER, created_at DATETIME, context_files JSON)""",
+    """CREATE TABLE test_results (
+        id INTEGER PRIMARY KEY, prompt_id VARCHAR(36) NOT NULL REFERENCES prompts(id),
+        test_input TEXT NOT NULL, test_output TEXT NOT NULL, created_at DATETIME)""",
+    """CREATE TABLE file_uploads (
+        id INTEGER PRIMARY KEY, filename VARCHAR(255) NOT NULL, original_name VARCHAR(255) NOT NULL,
+        file_type VARCHAR(100) NOT NULL, file_size INTEGER NOT NULL, file_path VARCHAR(500) NOT NULL, upload_date DATETIME)""",
+    """INSERT INTO prompts (id, original_idea, generated_prompt_json, generated_prompt_text, rating, created_at)
+        VALUES ('legacy-prompt', 'idea', '{}', 'text', 0, '2024-01-01 00:00:00')""",
+]
+
+
+def legacy_engine(directory: str):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'legacy.db')}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+    return engine
+
+
+def test_fresh_database_reaches_latest_version():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'fresh.db')}")
+        assert migrations.current_version(engine) == 0
+        assert migrations.upgrade(engine, Base.metadata) == migrations.LATEST_VERSION
+        assert migrations.current_version(engine) == migrations.LATEST_VERSION
+        engine.dispose()
+
+
+def test_pre_versioning_database_upgrades():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = legacy_engine(directory)
+        assert migrations.upgrade(engine, Base.metadata) == migrations.LATEST_VERSION
+
+        inspector = inspect(engine)
+        assert "idx_prompts_created_at" in {index["name"] for index in inspector.get_indexes("prompts")}
+        assert {"input_tokens", "output_tokens", "tokens_estimated"} <= {column["name"] for column in inspector.get_columns("prompts")}
+        with engine.connect() as connection:
+            versions = [row[0] for row in connection.execute(text("SELECT version FROM schema_version ORDER BY version"))]
+            assert versions == [number for number, _, _ in migrations.MIGRATIONS]
+            changes = connection.execute(text("SELECT seq, prompt_id FROM prompt_changes")).all()
+            assert [prompt_id for _, prompt_id in changes] == ["legacy-prompt"]
+            counter = connection.execute(text("SELECT value FROM sequence_counters WHERE name = 'prompt_changes'")).scalar()
+            assert counter == changes[0][0]  # The next change gets a fresh sequence number
+        engine.dispose()
+
+
+def test_upgrade_is_a_no_op_when_current():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = legacy_engine(directory)
+        migrations.upgrade(engine, Base.metadata)
+        assert migrations.upgrade(engine, Base.metadata) == migrations.LATEST_VERSION
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT COUNT(*) FROM prompt_changes")).scalar() == 1
+            assert connection.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == migrations.LATEST_VERSION
+        engine.dispose()
+
@@ -0,0 +1,51 @@
+"""
+Profiler tests: which requests count towards a session, and which threads are sampled
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import SamplingProfiler
+
+
+def test_admin_probe_and_stream_requests_do_not_count():
+    profiler = SamplingProfiler()
+    profiler.start(seconds=10, requests=2)
+    try:
+        for path in ("/api/admin/profile", "/api/health", "/", "/api/metrics", "/api/evaluations/abc/stream"):
+            profiler.request_finished(path)
+        assert profiler.running and profiler.status()["requests_left"] == 2
+
+        profiler.request_finished("/api/prompts")
+        profiler.request_finished("/api/generate")
+        profiler._thread.join(timeout=5)
+        assert not profiler.running
+    finally:
+        profiler.stop()
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_idle_threads_are_not_sampled():
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(lambda: None).result()  # Leaves one worker parked on its queue
+        waiter = threading.Thread(target=stop.wait)
+        busy = threading.Thread(target=busy_loop, args=(stop,))
+        waiter.start()
+        busy.start()
+
+        profiler = SamplingProfiler()
+        profiler.start(seconds=0.3, interval_ms=2)
+        profiler._thread.join()
+        stop.set()
+        busy.join()
+        waiter.join()
+
+    stacks = [line.rsplit(" ", 1)[0] for line in profiler.folded().splitlines()]
+    assert any("busy_loop (" in stack for stack in stacks)
+    leaves = {stack.split(";")[-1] for stack in stacks}
+    assert not any(leaf.startswith(("_worker (thread.py", "wait (threading.py")) for leaf in leaves), leaves
@@ -0,0 +1,59 @@
+"""
+Prompt template tests: compilation, rendering, and the render endpoint's test results
+"""
+
+from sqlalchemy import text
+
+import main
+from prompt_templates import compile_template
+
+
+def test_variables_in_first_seen_order():
+    plan = compile_template("Translate {{text}} to {{ lang }}, keep {{text}} short")
+    assert plan.variables == ["text", "lang"]
+
+
+def test_literal_braces_survive():
+    outputs, errors = compile_template('Return {"answer": "{{value}}"}').render_batch([{"value": 42}])
+    assert outputs == ['Return {"answer": "42"}'] and errors == []
+
+
+def test_missing_error_policy():
+    plan = compile_template("Answer {{input}} in {{lang}}")
+    outputs, errors = plan.render_batch([{"input": "a", "lang": "fr"}, {"input": "b"}], missing="error")
+    assert outputs == ["Answer a in fr", None]
+    assert errors == [{"index": 1, "missing": ["lang"]}]
+
+
+def test_missing_empty_policy():
+    outputs, errors = compile_template("Answer {{input}} in {{lang}}").render_batch([{"input": "b"}], missing="empty")
+    assert outputs == ["Answer b in "] and errors == []
+
+
+def test_missing_keep_policy():
+    outputs, errors = compile_template("Answer {{input}} in {{lang}}").render_batch([{"input": "b"}], missing="keep")
+    assert outputs == ["Answer b in {{lang}}"] and errors == []
+
+
+def test_compiled_plans_are_reused():
+    assert compile_template("Hello {{name}}") is compile_template("Hello {{name}}")
+
+
+
+def test_render_with_test_then_delete(client, db):
+    prompt_id = client.post("/api/generate", json={"idea": "summarize a topic"}).json()["id"]
+    assert client.put(f"/api/prompts/{prompt_id}/template", json={"template": "Summarize {{topic}}"}).status_code == 200
+
+    response = client.post(f"/api/prompts/{prompt_id}/render", json={"variables": [{"topic": "tides"}, {}, {"topic": "bees"}], "test": True})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["outputs"] == ["Summarize tides", None, "Summarize bees"]
+    assert body["test_results"][1] is None and all(body["test_results"][::2])
+    assert db.query(main.TestResult).filter(main.TestResult.prompt_id == prompt_id).count() == 2
+
+    # The stored test results must not block or outlive the prompt
+    assert client.delete(f"/api/prompts/{prompt_id}").status_code == 200
+    db.expire_all()
+    assert db.query(main.TestResult).filter(main.TestResult.prompt_id == prompt_id).count() == 0
+    assert db.query(main.PromptTemplate).filter(main.PromptTemplate.prompt_id == prompt_id).count() == 0
+    assert db.execute(text("PRAGMA foreign_key_check")).fetchall() == []
@@ -0,0 +1,89 @@
+"""
+Model provider tests: record/replay round trip, replay latency, routing and cache namespaces
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+
+import main
+from providers import DEFAULT_ROUTES, ModelProvider, ModelRouter, ProviderError, RecordingProvider, ReplayProvider, StubProvider
+
+
+@pytest.fixture
+def cassette_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, "cassettes", "responses.jsonl")
+
+
+def test_provider_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ModelProvider()
+
+
+def test_record_then_replay(cassette_path):
+    config = {"temperature": 0.2}
+    recorder = RecordingProvider(StubProvider(latency_ms=20), cassette_path)
+    recorded = asyncio.run(recorder.complete("model-a", "hello there", config))
+
+    replay = ReplayProvider(cassette_path)
+    replayed = asyncio.run(replay.complete("model-a", "hello there", config))
+    assert (replayed.text, replayed.model, replayed.usage) == (recorded.text, recorded.model, recorded.usage)
+    assert replayed.latency_ms == recorded.latency_ms == 20
+
+    with pytest.raises(ProviderError):
+        asyncio.run(replay.complete("model-a", "hello there", {"temperature": 0.9}))  # Different config, different request
+    assert replay.misses == 1
+
+
+def test_replay_scales_recorded_latency(cassette_path):
+    recorder = RecordingProvider(StubProvider(latency_ms=200), cassette_path)
+    asyncio.run(recorder.complete("model-a", "slow request", {}))
+
+    start = time.perf_counter()
+    asyncio.run(ReplayProvider(cassette_path, speed=4.0).complete("model-a", "slow request", {}))
+    elapsed = time.perf_counter() - start
+    assert 0.045 <= elapsed < 0.15
+
+    start = time.perf_counter()
+    asyncio.run(ReplayProvider(cassette_path, speed=0).complete("model-a", "slow request", {}))  # 0 replays instantly
+    assert time.perf_counter() - start < 0.045
+
+
+def test_routes_fall_back_to_test():
+    stub = StubProvider()
+    routes = {name: dict(settings, provider="stub") for name, settings in DEFAULT_ROUTES.items()}
+    routes["evaluate"] = {**routes["test"], "model": "cheap-model"}
+    router = ModelRouter({"stub": stub}, routes)
+    assert router.route("evaluate").model == "cheap-model"
+    assert router.route("render").model == router.route("test").model == DEFAULT_ROUTES["test"]["model"]
+
+    with pytest.raises(ValueError):
+        ModelRouter({"stub": stub}, {"test": {**routes["test"], "provider": "missing"}})
+
+
+def test_cache_namespace_changes_with_what_produces_the_output():
+    routes = {name: dict(settings, provider="stub") for name, settings in DEFAULT_ROUTES.items()}
+    router = ModelRouter({"stub": StubProvider()}, routes)
+    namespace = router.cache_namespace("generate")
+    assert namespace.startswith(f"stub:{DEFAULT_ROUTES['generate']['model']}:")
+    assert namespace != router.cache_namespace("test")
+    assert router.cache_namespace("evaluate") == router.cache_namespace("test")
+
+    warmer = {**routes, "generate": {**routes["generate"], "generationConfig": {**routes["generate"]["generationConfig"], "temperature": 0.9}}}
+    assert ModelRouter({"stub": StubProvider()}, warmer).cache_namespace("generate") != namespace
+
+
+def test_replay_miss_returns_502(client, cassette_path, monkeypatch):
+    os.makedirs(os.path.dirname(cassette_path))
+    open(cassette_path, "w").close()  # Empty cassette: every request misses
+    routes = {name: dict(settings, provider="replay") for name, settings in DEFAULT_ROUTES.items()}
+    service = main.AIService(router=ModelRouter({"replay": ReplayProvider(cassette_path)}, routes, mode="replay"))
+    monkeypatch.setattr(main, "get_ai_service", lambda: service)
+
+    response = client.post("/api/test", json={"prompt": "not in the cassette"})
+    assert response.status_code == 502
+    assert client.post("/api/generate", json={"idea": "not in the cassette"}).status_code == 502
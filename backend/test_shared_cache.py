@@ -0,0 +1,82 @@
+"""
+Shared cache tests: expiry, LRU eviction and the trigger-maintained size total
+"""
+
+import os
+import tempfile
+
+import pytest
+
+import shared_cache
+from shared_cache import SharedCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(shared_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache_path():
+    with tempfile.TemporaryDirectory() as directory:
+        yield os.path.join(directory, "cache.db")
+
+
+def stored_size(cache: SharedCache) -> int:
+    return cache._connection().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+
+def test_entries_expire_after_ttl(clock, cache_path):
+    cache = SharedCache(cache_path)
+    cache.set("stats:a", {"count": 1}, ttl=5)
+    cache.set("file:b", "kept")
+    clock.now += 4
+    assert cache.get("stats:a") == {"count": 1}
+    clock.now += 2
+    assert cache.get("stats:a") is None
+    assert cache.get("file:b") == "kept"
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_to_ninety_percent(clock, cache_path):
+    cache = SharedCache(cache_path, max_bytes=1000)
+    value = "x" * 98  # 100 bytes once JSON encoded
+    for i in range(10):
+        cache.set(f"gen:{i}", value)
+        clock.now += 10
+    cache.get("gen:0")  # Touched, so it is now the most recently used
+
+    cache.set("gen:10", value)
+    stats = cache.stats()
+    assert stats["bytes"] == 900 == stored_size(cache) and stats["entries"] == 9  # Only as much as needed
+    assert cache.get("gen:0") == value and cache.get("gen:10") == value
+    assert cache.get("gen:1") is None and cache.get("gen:2") is None
+
+
+def test_triggers_track_total_size(clock, cache_path):
+    cache = SharedCache(cache_path)
+    cache.set("gen:a", "short")
+    cache.set("gen:b", "a much longer value than the first")
+    cache.set("gen:a", "rewritten with a different length")
+    assert cache.stats()["bytes"] == stored_size(cache)
+    cache.delete("gen:b")
+    assert cache.stats()["bytes"] == stored_size(cache)
+    cache.clear()
+    assert cache.stats()["bytes"] == 0 and cache.stats()["entries"] == 0
+
+
+def test_eviction_stops_when_total_has_drifted(clock, cache_path):
+    cache = SharedCache(cache_path, max_bytes=1000)
+    cache._connection().execute("UPDATE cache_meta SET total_size = 10000000 WHERE id = 1")
+    cache.set("gen:a", "value")  # Must not loop forever deleting from an empty table
+    assert cache.stats()["bytes"] == stored_size(cache) == 0
@@ -0,0 +1,130 @@
+"""
+Similarity index tests: ranking, compaction, shared directories, rebuild swaps and change-feed sync
+"""
+
+import os
+import time
+import uuid
+import tempfile
+import multiprocessing
+
+import main
+from similarity_index import SimilarityIndex
+
+
+def new_id() -> str:
+    return str(uuid.uuid4())
+
+
+def test_search_ranks_related_prompt_first():
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory, dim=64)
+        python_id, email_id = new_id(), new_id()
+        index.add(python_id, "write a python function to sort a list")
+        index.add(email_id, "draft a marketing email for running shoes")
+        results = index.search("sort a python list", k=2)
+        assert results[0][0] == python_id
+        assert index.search("sort a python list", k=2, exclude=python_id)[0][0] != python_id
+
+
+def test_replace_keeps_single_row():
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory, dim=64)
+        prompt_id = new_id()
+        index.add(prompt_id, "first text")
+        index.add(prompt_id, "second text")
+        assert len(index) == 1 and index.count == 1
+
+
+def test_compaction_and_reopen():
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory, dim=64, initial_capacity=8)
+        ids = [new_id() for _ in range(200)]
+        index.add_many((prompt_id, f"prompt number {i} about python") for i, prompt_id in enumerate(ids))
+        for prompt_id in ids[:150]:
+            index.remove(prompt_id)
+        assert len(index) == 50
+        assert index.count < 200  # Dead rows were compacted away
+
+        reopened = SimilarityIndex(directory, dim=64)
+        assert len(reopened) == 50
+        found = {prompt_id for prompt_id, _ in reopened.search("python prompt", k=100)}
+        assert found and found <= set(ids[150:])
+
+
+def _add_from_worker(directory, count, queue):
+    index = SimilarityIndex(directory, dim=64, initial_capacity=8)
+    ids = [new_id() for _ in range(count)]
+    for i, prompt_id in enumerate(ids):
+        index.add(prompt_id, f"worker {os.getpid()} prompt {i}")
+    queue.put(ids)
+
+
+def test_processes_share_one_directory():
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory, dim=64, initial_capacity=8)
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_add_from_worker, args=(directory, 30, queue)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        ids = [prompt_id for _ in workers for prompt_id in queue.get()]
+        for worker in workers:
+            worker.join()
+        assert len(index) == len(ids) == 90  # No worker overwrote another's rows
+        assert len(SimilarityIndex(directory, dim=64)) == 90
+
+
+
+def test_rebuild_swaps_files_under_open_readers():
+    with tempfile.TemporaryDirectory() as directory:
+        reader = SimilarityIndex(directory, dim=64)
+        old_id, new_ids = new_id(), [new_id() for _ in range(20)]
+        reader.add(old_id, "legacy prompt about databases")
+        assert reader.synced_seq() is None
+
+        writer = SimilarityIndex(directory, dim=64)
+        assert writer.rebuild(((prompt_id, f"rebuilt prompt {i} about python") for i, prompt_id in enumerate(new_ids)), seq=7)
+        # The reader still has the old files mapped; the new epoch in meta.json makes it remap
+        assert len(reader) == 20 and reader.synced_seq() == 7
+        found = {prompt_id for prompt_id, _ in reader.search("rebuilt prompt about python", k=50)}
+        assert found and found <= set(new_ids)
+        assert old_id not in {prompt_id for prompt_id, _ in reader.search("legacy prompt about databases", k=50)}
+        assert not [name for name in os.listdir(directory) if name.startswith(".rebuild-")]
+
+
+def test_apply_changes_is_idempotent():
+    with tempfile.TemporaryDirectory() as directory:
+        index = SimilarityIndex(directory, dim=64)
+        index.rebuild([], seq=0)
+        kept, dropped = new_id(), new_id()
+        index.add(kept, "already applied by the request")  # Live updates do not move the sync position
+        for _ in range(2):
+            index.apply_changes([(kept, "sort a list in python"), (dropped, "to be deleted")], [], seq=3)
+            index.apply_changes([], [dropped, new_id()], seq=4)
+        assert len(index) == 1 and index.synced_seq() == 4
+        assert index.search("python list", k=5)[0][0] == kept
+
+
+def test_sync_catches_up_without_rebuild(client, db, monkeypatch):
+    index = main.get_similarity_index()
+    deadline = time.monotonic() + 10
+    while index.synced_seq() is None and time.monotonic() < deadline:
+        main.sync_similarity_index()  # Skips while the startup sync is still rebuilding
+        time.sleep(0.05)
+    synced = index.synced_seq()
+    assert synced is not None
+
+    # Another worker commits a prompt whose index update this process never saw
+    prompt = main.Prompt(original_idea="translate a recipe into french", generated_prompt_json="{}", generated_prompt_text="You translate recipes")
+    db.add(prompt)
+    db.flush()
+    main.record_prompt_change(db, prompt.id, "upsert")
+    db.commit()
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("an up-to-date index should not be rebuilt")
+
+    monkeypatch.setattr(index, "rebuild", no_rebuild)
+    main.sync_similarity_index()
+    assert index.synced_seq() > synced
+    assert index.search("translate recipe french", k=1)[0][0] == prompt.id
@@ -0,0 +1,44 @@
+"""
+Token accounting tests: estimates, truncation, input budgets and provider usage
+"""
+
+from tokens import TRUNCATION_MARKER, estimate_tokens, fit_generation_input, truncate_to_tokens, usage_from_response
+
+CODE_IDEA = "Fix this code:\ndef f(x):\n    if x:\n        return 1"
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello, world") == 5  # "hello" 2 + "," 1 + "world" 2
+
+
+def test_truncate_keeps_head_and_tail():
+    text = "start " + "middle " * 2000 + "end"
+    truncated = truncate_to_tokens(text, 100)
+    assert estimate_tokens(truncated) <= 100
+    assert truncated.startswith("start") and truncated.endswith("end") and TRUNCATION_MARKER in truncated
+    assert truncate_to_tokens("short text", 100) == "short text"
+
+
+def test_in_budget_request_is_unchanged():
+    files = [{"name": "a.py"}, {"name": "b.py"}]
+    assert fit_generation_input("system", CODE_IDEA, files, 4000) == (CODE_IDEA, files, False)
+
+
+def test_over_budget_drops_files_before_cutting_idea():
+    files = [{"name": f"file_{i}.py"} for i in range(200)]
+    idea, kept, trimmed = fit_generation_input("system", "short idea", files, 300)
+    assert trimmed and idea == "short idea" and 0 < len(kept) < len(files)
+    assert kept == files[:len(kept)]
+
+
+def test_over_budget_idea_is_truncated():
+    idea, kept, trimmed = fit_generation_input("system", "word   " * 5000, [{"name": "a.py"}], 500)
+    assert trimmed and kept == []
+    assert estimate_tokens(idea) <= 500
+
+
+def test_usage_prefers_provider_counts():
+    assert usage_from_response({"promptTokenCount": 12, "candidatesTokenCount": 3}, "p", "o") == {"input_tokens": 12, "output_tokens": 3, "estimated": False}
+    assert usage_from_response(None, "two words", "one")["estimated"] is True
+
@@ -0,0 +1,86 @@
+"""
+Token accounting for Prompt Engine
+Local token estimates and input budgeting applied before requests reach the model
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+WHITESPACE_PATTERN = re.compile(r"[ \t]+")
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+# SentencePiece-style tokenizers average roughly four characters per token on English text
+CHARS_PER_TOKEN = 4
+TRUNCATION_MARKER = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local estimate: punctuation is one token, words one per ~4 characters"""
+    if not text:
+        return 0
+    return sum((len(piece) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN for piece in WORD_PATTERN.findall(text))
+
+
+def compress_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines, which cost tokens but carry nothing"""
+    return BLANK_LINES_PATTERN.sub("\n\n", WHITESPACE_PATTERN.sub(" ", text)).strip()
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Shorten text to roughly `budget` tokens, keeping its head and tail"""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    # Scale the character cut by how dense this text actually is, then tighten if needed
+    chars = int(len(text) * budget / estimate_tokens(text))
+    while chars > 0:
+        head = chars * 2 // 3
+        candidate = text[:head] + TRUNCATION_MARKER + text[len(text) - (chars - head):]
+        if estimate_tokens(candidate) <= budget:
+            return candidate
+        chars = int(chars * 0.9)
+    return ""
+
+
+def fit_generation_input(system_instruction: str, idea: str, files: Optional[List[Dict[str, Any]]], budget: int) -> Tuple[str, List[Dict[str, Any]], bool]:
+    """Make the generate request fit `budget` input tokens.
+
+    Requests within budget are returned unchanged. Otherwise the system
+    instruction is never cut: whitespace is compressed first, then context
+    files are dropped from the end, and finally the idea itself is truncated.
+    Returns the idea, the kept files and whether anything was trimmed.
+    """
+    files = files or []
+    available = budget - estimate_tokens(system_instruction) - 16  # Framing text around the idea
+    idea_tokens = estimate_tokens(idea)
+    file_tokens = [estimate_tokens(f" - {file_info.get('name', 'Unknown file')}") for file_info in files]
+    if idea_tokens + sum(file_tokens) <= available:
+        return idea, files, False
+
+    compressed = compress_whitespace(idea)
+    trimmed = compressed != idea
+    idea = compressed
+    idea_tokens = estimate_tokens(idea)
+    while files and idea_tokens + sum(file_tokens) > available:
+        files = files[:-1]
+        file_tokens.pop()
+        trimmed = True
+
+    if idea_tokens > available:
+        idea = truncate_to_tokens(idea, max(available, 0))
+        trimmed = True
+
+    return idea, files, trimmed
+
+
+def usage_from_response(usage: Optional[Dict[str, int]], prompt: str, output: str) -> Dict[str, Any]:
+    """Normalize provider usage metadata, falling back to local estimates"""
+    if usage and "promptTokenCount" in usage:
+        return {
+            "input_tokens": usage["promptTokenCount"],
+            "output_tokens": usage.get("candidatesTokenCount", 0),
+            "estimated": False,
+        }
+    return {"input_tokens": estimate_tokens(prompt), "output_tokens": estimate_tokens(output), "estimated": True}